@@ -24,14 +24,21 @@ def run_task(task_name, config_path):
         controller._connect()
         AutoRemoveWorker(controller).execute(dry_run=False)
 
+def run_replay(log_path, config_path):
+    from src.replay import run_replay, format_report
+    print(format_report(run_replay(log_path, config_path)))
+
 def main():
     ensure_logs()
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", default=os.path.join(os.path.dirname(__file__), "config.json"))
-    parser.add_argument("--task", choices=['rss', 'autoremove'])
+    parser.add_argument("--task", choices=['rss', 'autoremove', 'replay'])
+    parser.add_argument("--log", help="replay 使用的录制日志 (config 中 record_path 生成)")
     args = parser.parse_args()
 
-    if args.task:
+    if args.task == 'replay':
+        run_replay(args.log, args.config)
+    elif args.task:
         run_task(args.task, args.config)
     else:
         try: Controller(args.config).run()
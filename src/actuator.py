@@ -0,0 +1,100 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Tuple, Deque
+from .consts import C
+from .utils import logger
+from .perf import RttEstimator
+
+class LimitActuator:
+    """并发下发上传/下载限速，复用 qB 客户端的 keep-alive 连接池"""
+
+    def __init__(self, client=None, workers: int = C.ACTUATOR_WORKERS):
+        self.client = client
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Actuator")
+        self._lock = threading.Lock()
+        self._applied: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._inflight: Dict[Tuple[str, str], int] = {}
+        self.latencies: Deque[float] = deque(maxlen=500)
+        self.rtt = RttEstimator()
+        self.writes = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def set_client(self, client):
+        self.client = client
+        with self._lock:
+            self._applied.clear(); self._inflight.clear()
+
+    def forget(self, h: str):
+        with self._lock:
+            for kind in ('up', 'dl'):
+                self._applied.pop((kind, h), None)
+
+    def _write(self, kind: str, limit: int, hashes: List[str]) -> bool:
+        fn = self.client.torrents_set_upload_limit if kind == 'up' else self.client.torrents_set_download_limit
+        ok = False
+        for attempt in range(C.ACTUATOR_RETRIES + 1):
+            t0 = time.perf_counter()
+            try:
+                fn(limit, hashes)
+                ok = True
+            except Exception as e:
+                if attempt >= C.ACTUATOR_RETRIES: logger.warning(f"⚠️ 限速下发失败 {kind}={limit} ({len(hashes)} 个种子): {e}")
+            elapsed = time.perf_counter() - t0
+            self.latencies.append(elapsed)
+            if ok:
+                with self._lock: self.rtt.observe(elapsed)
+            if ok: break
+            # 最后一次失败后不再等待，避免在 qB 不可用时白白占住工作线程
+            if attempt < C.ACTUATOR_RETRIES: time.sleep(C.ACTUATOR_RETRY_DELAY * (attempt + 1))
+        done = time.monotonic()
+        with self._lock:
+            self.writes += 1
+            if not ok: self.failures += 1
+            for h in hashes:
+                key = (kind, h)
+                if self._inflight.get(key) == limit: del self._inflight[key]
+                if ok: self._applied[key] = (limit, done)
+                else: self._applied.pop(key, None)
+        return ok
+
+    def _plan(self, kind: str, actions: Dict[int, List[str]]) -> List[Tuple[str, int, List[str]]]:
+        jobs = []; now = time.monotonic()
+        with self._lock:
+            for limit, hashes in actions.items():
+                todo = []
+                for h in hashes:
+                    key = (kind, h)
+                    applied = self._applied.get(key)
+                    # 相同值已在途，或刚写入成功而 qB 状态尚未刷新：合并掉
+                    if self._inflight.get(key) == limit or (applied and applied[0] == limit and now - applied[1] < C.ACTUATOR_COALESCE_TTL):
+                        self.coalesced += 1; continue
+                    self._inflight[key] = limit
+                    todo.append(h)
+                if todo: jobs.append((kind, limit, todo))
+        return jobs
+
+    def apply(self, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]], timeout: float = C.ACTUATOR_TIMEOUT):
+        jobs = self._plan('up', up_actions) + self._plan('dl', dl_actions)
+        if not jobs: return
+        try: futures = [self._pool.submit(self._write, kind, limit, hashes) for kind, limit, hashes in jobs]
+        except RuntimeError:
+            # 已 close：仍在运行的子实例 tick 不再下发
+            with self._lock:
+                for kind, limit, hashes in jobs:
+                    for h in hashes: self._inflight.pop((kind, h), None)
+            return
+        # 超时未完成的写入在后台继续，并计入 inflight 以便下个 tick 合并
+        wait(futures, timeout=timeout)
+
+    def summary(self) -> str:
+        lat = sorted(self.latencies)
+        if not lat: return f"writes={self.writes}"
+        p50 = lat[len(lat) // 2] * 1000; pmax = lat[-1] * 1000
+        return f"writes={self.writes} coalesced={self.coalesced} fail={self.failures} p50={p50:.1f}ms max={pmax:.1f}ms srtt={self.rtt.srtt * 1000:.1f}ms"
+
+    def close(self):
+        # 取消排队中的写入并等在途写入结束 (最多一轮重试)，之后的 -1 复位才不会被旧限速覆盖
+        self._pool.shutdown(wait=True, cancel_futures=True)
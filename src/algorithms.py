@@ -1,10 +1,13 @@
 import threading
-from collections import deque
-from typing import Tuple, Dict, List, Any, Optional, Deque
+from array import array
+from typing import Tuple, Dict, List, Any
 from .consts import C
 from .utils import safe_div, clamp
 
 class PIDController:
+    __slots__ = ('kp', 'ki', 'kd', '_integral', '_last_error', '_last_time', '_last_output',
+                 '_initialized', '_integral_limit', '_derivative_filter')
+    
     def __init__(self):
         self.kp = 0.6; self.ki = 0.15; self.kd = 0.08
         self._integral = 0.0; self._last_error = 0.0; self._last_time = 0.0
@@ -40,28 +43,43 @@ class PIDController:
     def reset(self):
         self._integral = 0.0; self._last_error = 0.0; self._last_time = 0.0
         self._last_output = 1.0; self._derivative_filter = 0.0; self._initialized = False
+    
+    def warm_start(self):
+        # 保留部分积分 (系统性偏差)，微分与输出重新起步
+        integral = self._integral * C.WARM_INTEGRAL_KEEP
+        self.reset()
+        self._integral = integral
 
 class ExtendedKalman:
+    __slots__ = ('speed', 'accel', 'p00', 'p01', 'p10', 'p11', '_last_time', '_initialized')
+    
     def __init__(self):
         self.speed = 0.0; self.accel = 0.0
         self.p00 = 1000.0; self.p01 = 0.0; self.p10 = 0.0; self.p11 = 1000.0
         self._last_time = 0.0; self._initialized = False
     
     def update(self, measurement: float, now: float) -> Tuple[float, float]:
+        return self._step(measurement, now, C.KALMAN_Q_SPEED, C.KALMAN_Q_ACCEL, C.KALMAN_R)
+    
+    def _step(self, measurement: float, now: float, q_speed: float, q_accel: float, r: float) -> Tuple[float, float]:
         if not self._initialized:
             self.speed = measurement; self._last_time = now; self._initialized = True
             return measurement, 0.0
+        if self._last_time < 0:
+            # 从数据库恢复的估计：先对齐时间基准
+            self._last_time = now
+            return self.speed, self.accel
         dt = now - self._last_time
         if dt <= 0.01: return self.speed, self.accel
         self._last_time = now
         
         pred_speed = self.speed + self.accel * dt
-        p00_pred = self.p00 + dt * (self.p10 + self.p01) + dt * dt * self.p11 + C.KALMAN_Q_SPEED
+        p00_pred = self.p00 + dt * (self.p10 + self.p01) + dt * dt * self.p11 + q_speed
         p01_pred = self.p01 + dt * self.p11
         p10_pred = self.p10 + dt * self.p11
-        p11_pred = self.p11 + C.KALMAN_Q_ACCEL
+        p11_pred = self.p11 + q_accel
         
-        s = p00_pred + C.KALMAN_R
+        s = p00_pred + r
         if abs(s) < 1e-10: return self.speed, self.accel
         k0, k1 = p00_pred / s, p10_pred / s
         innovation = measurement - pred_speed
@@ -80,39 +98,106 @@ class ExtendedKalman:
     def reset(self):
         self.speed = 0.0; self.accel = 0.0; self.p00 = 1000.0
         self.p01 = 0.0; self.p10 = 0.0; self.p11 = 1000.0; self._initialized = False
+    
+    def warm_start(self, scale: float = 1.0):
+        # 沿用上一周期收敛的速度，按新条件缩放；加速度清零，协方差适度放大以便重新收敛
+        if not self._initialized: return self.reset()
+        self.speed *= scale; self.accel = 0.0
+        self.p00 = self.p11 = C.WARM_KALMAN_P; self.p01 = self.p10 = 0.0
+
+class DownloadKalman(ExtendedKalman):
+    """下载速度估计：与上传同构，噪声参数单独配置 (下载速度抖动更大，观测更不可信)"""
+    __slots__ = ()
+    
+    def update(self, measurement: float, now: float) -> Tuple[float, float]:
+        return self._step(measurement, now, C.DL_KALMAN_Q_SPEED, C.DL_KALMAN_Q_ACCEL, C.DL_KALMAN_R)
+    
+    def time_to_finish(self, remaining: float) -> float:
+        """按估计的速度与加速度求完成剩余量所需秒数"""
+        if remaining <= 0: return 0.0
+        v = self.speed
+        if v <= 0: return float('inf')
+        # 匀加速下的平均速度，限制在当前估计的 0.5~1.5 倍，避免短暂抖动被外推过头
+        avg = clamp(v + 0.5 * self.accel * (remaining / v), 0.5 * v, 1.5 * v)
+        return remaining / avg
+
+def _regrow(buf: array, n: int, cap: int, new_cap: int) -> array:
+    # 按绝对序号把环里最近的样本搬进更大的环
+    out = array(buf.typecode, bytes(buf.itemsize * new_cap))
+    for i in range(max(0, n - cap), n): out[i % new_cap] = buf[i % cap]
+    return out
 
 class MultiWindowSpeedTracker:
-    def __init__(self):
-        self._lock = threading.Lock()
-        self._samples: Deque[Tuple[float, float]] = deque(maxlen=1200)
+    """多窗口速度统计：array 环形缓冲 + 前缀和，每个窗口维护起点指针，查询为 O(1) 摊还。
+    环按需倍增，只保留最大窗口内的样本，上限 maxlen"""
+    __slots__ = ('_maxlen', '_cap', '_ts', '_cum', '_n', '_total', '_starts')
+    TREND_WINDOW = 10
+    INITIAL = 64
+    
+    def __init__(self, maxlen: int = 1200):
+        self._maxlen = maxlen
+        self._alloc(min(self.INITIAL, maxlen) + 1)  # 多留一格，保证最旧样本之前的前缀和仍可读
+        self._n = 0
+        self._total = 0.0
+        self._starts: Dict[int, int] = {}
+    
+    def _alloc(self, cap: int):
+        self._cap = cap
+        self._ts = array('d', bytes(8 * cap))
+        self._cum = array('d', bytes(8 * cap))
     
     def record(self, now: float, speed: float):
-        with self._lock: self._samples.append((now, speed))
+        n = self._n; cap = self._cap
+        # 即将失效的最旧样本仍在最大窗口内：扩容而不是覆盖
+        if n >= cap - 1 and cap - 1 < self._maxlen and now - self._ts[(n - cap + 1) % cap] <= max(C.SPEED_WINDOWS):
+            new_cap = min(self._maxlen, 2 * (cap - 1)) + 1
+            self._ts = _regrow(self._ts, n, cap, new_cap); self._cum = _regrow(self._cum, n, cap, new_cap)
+            self._cap = cap = new_cap
+        slot = n % cap
+        self._total += speed
+        self._ts[slot] = now; self._cum[slot] = self._total
+        self._n = n + 1
+    
+    def _start(self, now: float, window: int) -> int:
+        # 时间戳单调递增：指针随 now 前移，now 回退时再向前回拨
+        lo = max(0, self._n - self._cap + 1)
+        i = max(lo, min(self._starts.get(window, lo), self._n))
+        ts = self._ts; cap = self._cap
+        while i < self._n and now - ts[i % cap] > window: i += 1
+        while i > lo and now - ts[(i - 1) % cap] <= window: i -= 1
+        self._starts[window] = i
+        return i
+    
+    def _sum(self, a: int, b: int) -> float:
+        # 样本 [a, b) 之和
+        end = self._cum[(b - 1) % self._cap]
+        return end - (self._cum[(a - 1) % self._cap] if a > 0 else 0.0)
     
     def get_weighted_avg(self, now: float, phase: str) -> float:
         weights = C.WINDOW_WEIGHTS.get(phase, C.WINDOW_WEIGHTS['steady'])
-        with self._lock: samples = list(self._samples)
-        
         total_weight = 0.0; weighted_sum = 0.0
+        n = self._n
         for window in C.SPEED_WINDOWS:
-            win_samples = [s for t, s in samples if now - t <= window]
-            if win_samples:
-                avg = sum(win_samples) / len(win_samples)
+            a = self._start(now, window)
+            if a < n:
+                avg = self._sum(a, n) / (n - a)
                 w = weights.get(window, 0.25)
                 weighted_sum += avg * w; total_weight += w
         return weighted_sum / total_weight if total_weight > 0 else 0.0
     
-    def get_recent_trend(self, now: float, window: int = 10) -> float:
-        with self._lock:
-            samples = [(t, s) for t, s in self._samples if now - t <= window]
-        if len(samples) < 5: return 0.0
-        mid = len(samples) // 2
-        first = sum(s for _, s in samples[:mid]) / mid
-        second = sum(s for _, s in samples[mid:]) / (len(samples) - mid)
+    def get_recent_trend(self, now: float, window: int = TREND_WINDOW) -> float:
+        n = self._n
+        a = self._start(now, window)
+        count = n - a
+        if count < 5: return 0.0
+        mid = count // 2
+        first = self._sum(a, a + mid) / mid
+        second = self._sum(a + mid, n) / (count - mid)
         return safe_div(second - first, first, 0)
     
     def clear(self):
-        with self._lock: self._samples.clear()
+        self._n = 0; self._total = 0.0; self._starts.clear()
+        if self._cap > self.INITIAL + 1: self._alloc(min(self.INITIAL, self._maxlen) + 1)
 
 class AdaptiveQuantizer:
     @staticmethod
@@ -131,49 +216,128 @@ class AdaptiveQuantizer:
         step = int(clamp(step, 256, 8192))
         return max(C.MIN_LIMIT, int((limit + step // 2) // step) * step)
 
-class PrecisionTracker:
-    def __init__(self, window: int = 30):
-        self._history: Deque[Tuple[float, str, float]] = deque(maxlen=window)
-        self._phase_adj: Dict[str, float] = {'warmup': 1.0, 'catch': 1.0, 'steady': 1.0, 'finish': 1.0}
-        self._global_adj = 1.0
+class PrecisionModel:
+    """按 (tracker, 阶段, 体积档) 增量学习的精度修正：EWMA 均值 + 乘性步进，样本不足时逐级回退"""
+    ANY = -1
+    GLOBAL = ("", "", -1)
+    
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str, int], List[float]] = {}  # key -> [样本数, EWMA 比例, 修正系数]
+        self._dirty: set = set()
         self._lock = threading.Lock()
     
-    def record(self, ratio: float, phase: str, now: float):
-        with self._lock:
-            self._history.append((ratio, phase, now))
-            self._update()
-    
-    def _update(self):
-        if len(self._history) < 5: return
-        phase_data: Dict[str, List[float]] = {}
-        for ratio, phase, _ in self._history:
-            phase_data.setdefault(phase, []).append(ratio)
-        
-        for phase, ratios in phase_data.items():
-            if len(ratios) < 3: continue
-            avg = sum(ratios) / len(ratios)
+    @staticmethod
+    def size_bucket(total_size: int) -> int:
+        gib = total_size / 1073741824
+        for i, edge in enumerate(C.PRECISION_SIZE_BUCKETS_GIB):
+            if gib < edge: return i
+        return len(C.PRECISION_SIZE_BUCKETS_GIB)
+    
+    def _keys(self, tracker: str, phase: str, bucket: int) -> Tuple[Tuple[str, str, int], ...]:
+        # tracker 为空 (sync 首次联系 tracker 前) 时后两个键相同，去重以免同一周期记两次
+        return tuple(dict.fromkeys(((tracker, phase, bucket), (tracker, phase, self.ANY), ("", phase, self.ANY))))
+    
+    def _update(self, key: Tuple[str, str, int], ratio: float):
+        st = self._stats.get(key)
+        if st is None: st = self._stats[key] = [0, 1.0, 1.0]
+        st[0] += 1
+        st[1] += (ratio - st[1]) * max(1.0 / st[0], C.PRECISION_EWMA_ALPHA)
+        avg = st[1]
+        if key == self.GLOBAL:
+            if st[0] >= 5:
+                if avg > 1.002: st[2] = clamp(st[2] * 0.999, 0.95, 1.05)
+                elif avg < 0.995: st[2] = clamp(st[2] * 1.001, 0.95, 1.05)
+        elif st[0] >= C.PRECISION_MIN_SAMPLES:
             if avg > 1.005: adj = 0.998
             elif avg > 1.001: adj = 0.999
             elif avg < 0.99: adj = 1.002
             elif avg < 0.995: adj = 1.001
             else: adj = 1.0
-            self._phase_adj[phase] = clamp(self._phase_adj[phase] * adj, 0.92, 1.08)
-        
-        all_ratios = [r for r, _, _ in self._history]
-        global_avg = sum(all_ratios) / len(all_ratios)
-        if global_avg > 1.002: self._global_adj = clamp(self._global_adj * 0.999, 0.95, 1.05)
-        elif global_avg < 0.995: self._global_adj = clamp(self._global_adj * 1.001, 0.95, 1.05)
+            st[2] = clamp(st[2] * adj, 0.92, 1.08)
+        self._dirty.add(key)
+    
+    def record(self, tracker: str, phase: str, bucket: int, ratio: float):
+        with self._lock:
+            for key in self._keys(tracker, phase, bucket): self._update(key, ratio)
+            self._update(self.GLOBAL, ratio)
+    
+    def get_adjustment(self, tracker: str, phase: str, bucket: int) -> float:
+        with self._lock:
+            g = self._stats.get(self.GLOBAL)
+            base = g[2] if g else 1.0
+            for key in self._keys(tracker, phase, bucket):
+                st = self._stats.get(key)
+                if st and st[0] >= C.PRECISION_MIN_SAMPLES: return st[2] * base
+            return base
+    
+    def load(self, rows: List[Tuple[str, str, int, int, float, float]]):
+        with self._lock:
+            for tracker, phase, bucket, n, mean, adj in rows:
+                self._stats[(tracker or "", phase or "", int(bucket))] = [int(n), float(mean), float(adj)]
     
-    def get_adjustment(self, phase: str) -> float:
+    def dirty_rows(self) -> List[Tuple[str, str, int, int, float, float]]:
+        with self._lock:
+            rows = [(k[0], k[1], k[2], int(self._stats[k][0]), self._stats[k][1], self._stats[k][2]) for k in self._dirty]
+            self._dirty.clear()
+        return rows
+
+class AnnounceModel:
+    """按 (tracker, 年龄档) 学习汇报间隔：汇报后读到的 reannounce 即为完整间隔，EWMA 均值 + 平均偏差，连续两次不符则重学"""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, int], List[float]] = {}  # key -> [样本数, 间隔, 平均偏差, 连续不符次数]
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _confident(st: List[float]) -> bool:
+        return st[0] >= C.ANNOUNCE_MODEL_MIN_SAMPLES and st[3] == 0 and st[2] <= C.ANNOUNCE_MODEL_TOLERANCE
+
+    def observe(self, tracker: str, band: int, interval: float) -> bool:
+        """记录一次观测，返回是否与已学到的间隔相符"""
+        key = (tracker, band)
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None: st = self._stats[key] = [0, interval, 0.0, 0]
+            err = abs(interval - st[1])
+            ok = st[0] < C.ANNOUNCE_MODEL_MIN_SAMPLES or err <= max(C.ANNOUNCE_MODEL_TOLERANCE, 3 * st[2])
+            if ok:
+                st[0] += 1; st[3] = 0
+                alpha = max(1.0 / st[0], C.PRECISION_EWMA_ALPHA)
+                st[2] += (err - st[2]) * alpha
+                st[1] += (interval - st[1]) * alpha
+            else:
+                st[3] += 1
+                if st[3] >= 2: st[:] = [1, interval, 0.0, 0]
+            self._dirty.add(key)
+            return ok
+
+    def predict(self, tracker: str, band: int) -> Tuple[float, bool]:
+        """返回 (间隔, 是否可信)，没有样本时间隔为 0"""
+        st = self._stats.get((tracker, band))
+        if not st or st[0] <= 0: return 0.0, False
+        return st[1], self._confident(st)
+
+    def load(self, rows: List[Tuple[str, int, int, float, float, int]]):
         with self._lock:
-            return self._phase_adj.get(phase, 1.0) * self._global_adj
+            for tracker, band, n, mean, dev, misses in rows:
+                self._stats[(tracker or "", int(band))] = [int(n), float(mean), float(dev), int(misses)]
+
+    def dirty_rows(self) -> List[Tuple[str, int, int, float, float, int]]:
+        with self._lock:
+            rows = [(k[0], k[1], int(self._stats[k][0]), self._stats[k][1], self._stats[k][2], int(self._stats[k][3])) for k in self._dirty]
+            self._dirty.clear()
+        return rows
 
 class PrecisionLimitController:
+    __slots__ = ('kalman', 'speed_tracker', 'pid', '_smooth_limit', '_target')
+    
     def __init__(self):
         self.kalman = ExtendedKalman()
         self.speed_tracker = MultiWindowSpeedTracker()
         self.pid = PIDController()
         self._smooth_limit = -1
+        self._target = 0.0
     
     def record_speed(self, now: float, speed: float):
         self.kalman.update(speed, now)
@@ -183,6 +347,7 @@ class PrecisionLimitController:
                   phase: str, now: float, precision_adj: float = 1.0) -> Tuple[int, str, Dict]:
         debug: Dict[str, Any] = {}
         adjusted_target = target * precision_adj
+        self._target = target
         
         kalman_speed = self.kalman.speed
         weighted_speed = self.speed_tracker.get_weighted_avg(now, phase)
@@ -254,27 +419,80 @@ class PrecisionLimitController:
         self.speed_tracker.clear()
         self.pid.reset()
         self._smooth_limit = -1
+    
+    def warm_start(self, target: float = 0):
+        """新周期：从上一周期的收敛状态起步，速度估计按目标速度之比缩放"""
+        scale = target / self._target if target > 0 and self._target > 0 else 1.0
+        self.kalman.warm_start(scale)
+        self.speed_tracker.clear()
+        self.pid.warm_start()
+        self._smooth_limit = -1
+        if target > 0: self._target = target
+    
+    def export_state(self) -> Dict[str, Any]:
+        k = self.kalman
+        if not k._initialized: return {}
+        return {'k': [k.speed, k.accel, k.p00, k.p01, k.p10, k.p11], 'i': self.pid._integral, 't': self._target}
+    
+    def import_state(self, data: Dict[str, Any]):
+        try:
+            speed, accel, p00, p01, p10, p11 = [float(x) for x in data['k']]
+            integral = float(data.get('i', 0)); target = float(data.get('t', 0))
+        except (KeyError, TypeError, ValueError): return
+        k = self.kalman
+        k.speed, k.accel, k.p00, k.p01, k.p10, k.p11 = speed, accel, p00, p01, p10, p11
+        k._initialized = True; k._last_time = -1.0
+        self.pid.reset(); self.pid._integral = clamp(integral, -self.pid._integral_limit, self.pid._integral_limit)
+        self._target = target
 
 class SpeedTracker:
+    """累计上传/下载量的环形缓冲：时间戳与字节数分列存放在 array 中，窗口起点二分查找。
+    环按需倍增，只保留汇报窗口内的样本，上限 max_samples"""
+    __slots__ = ('_max', '_cap', '_ts', '_up', '_dl', '_n')
+    INITIAL = 64
+    
     def __init__(self, max_samples: int = 600):
-        self._lock = threading.Lock()
-        self._samples: Deque[Tuple[float, int, int, float, float]] = deque(maxlen=max_samples)
+        self._max = max_samples
+        self._alloc(min(self.INITIAL, max_samples))
+        self._n = 0
     
-    def record(self, ts: float, u: int, d: int, us: float, ds: float):
-        with self._lock: self._samples.append((ts, u, d, us, ds))
+    def _alloc(self, cap: int):
+        self._cap = cap
+        self._ts = array('d', bytes(8 * cap))
+        self._up = array('q', bytes(8 * cap))
+        self._dl = array('q', bytes(8 * cap))
     
-    def get_avg_speeds(self, window: float = 300) -> Tuple[float, float]:
-        now = time.time()
-        with self._lock:
-            samples = [(t, u, d, us, ds) for t, u, d, us, ds in self._samples if now - t <= window]
-        if len(samples) < 2: return 0, 0
-        first, last = samples[0], samples[-1]
-        dt = last[0] - first[0]
+    def record(self, ts: float, u: int, d: int, us: float = 0, ds: float = 0):
+        # us/ds 为瞬时速度，均值由累计量差分得到，不再保存
+        n = self._n; cap = self._cap
+        if n >= cap and cap < self._max and ts - self._ts[(n - cap) % cap] <= C.REANNOUNCE_SPEED_SAMPLES:
+            new_cap = min(self._max, 2 * cap)
+            self._ts = _regrow(self._ts, n, cap, new_cap)
+            self._up = _regrow(self._up, n, cap, new_cap); self._dl = _regrow(self._dl, n, cap, new_cap)
+            self._cap = cap = new_cap
+        slot = n % cap
+        self._ts[slot] = ts; self._up[slot] = int(u); self._dl[slot] = int(d)
+        self._n = n + 1
+    
+    def _start(self, now: float, window: float) -> int:
+        # 时间戳单调递增：二分找第一个 now - ts <= window 的样本
+        lo = max(0, self._n - self._cap); hi = self._n
+        ts = self._ts; cap = self._cap
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if now - ts[mid % cap] > window: lo = mid + 1
+            else: hi = mid
+        return lo
+    
+    def get_avg_speeds(self, now: float, window: float = 300) -> Tuple[float, float]:
+        n = self._n
+        a = self._start(now, window)
+        if n - a < 2: return 0, 0
+        i, j = a % self._cap, (n - 1) % self._cap
+        dt = self._ts[j] - self._ts[i]
         if dt <= 0: return 0, 0
-        return safe_div(last[1]-first[1], dt, 0), safe_div(last[2]-first[2], dt, 0)
+        return safe_div(self._up[j] - self._up[i], dt, 0), safe_div(self._dl[j] - self._dl[i], dt, 0)
     
     def clear(self):
-        with self._lock: self._samples.clear()
-
-# 全局实例
-_precision_tracker = PrecisionTracker()
+        self._n = 0
+        if self._cap > self.INITIAL: self._alloc(min(self.INITIAL, self._max))
@@ -0,0 +1,364 @@
+from typing import Dict, List, Tuple, Any
+from .consts import C
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+PHASES = (C.PHASE_WARMUP, C.PHASE_CATCH, C.PHASE_STEADY, C.PHASE_FINISH)
+PHASE_CODE = {p: i for i, p in enumerate(PHASES)}
+WARMUP, CATCH, STEADY, FINISH = range(4)
+
+# 分支编码，用于事后生成 reason 字符串
+B_REPORT, B_FINISH, B_STEADY, B_CATCH_OPEN, B_CATCH, B_W_OVER, B_W_FINE, B_W_WARM, B_W_OPEN = range(9)
+
+class _KalmanView:
+    __slots__ = ('_e', '_h')
+
+    def __init__(self, engine: 'BatchPrecisionEngine', h: str):
+        self._e = engine; self._h = h
+
+    @property
+    def speed(self) -> float:
+        self._e.flush()
+        return float(self._e.k_speed[self._e.index[self._h]])
+
+    @property
+    def accel(self) -> float:
+        self._e.flush()
+        return float(self._e.k_accel[self._e.index[self._h]])
+
+    def predict_upload(self, seconds: float) -> float:
+        return max(0, self.speed * seconds + 0.5 * self.accel * seconds * seconds)
+
+class BatchSlot:
+    """挂在 TorrentState.limit_controller 上的代理，状态实际存放在 BatchPrecisionEngine 的数组里"""
+    __slots__ = ('engine', 'hash', 'kalman')
+
+    def __init__(self, engine: 'BatchPrecisionEngine', h: str):
+        self.engine = engine
+        self.hash = h
+        self.kalman = _KalmanView(engine, h)
+
+    def record_speed(self, now: float, speed: float):
+        self.engine.push(self.hash, now, speed)
+
+    def calculate(self, target: float, uploaded: int, time_left: float, elapsed: float,
+                  phase: str, now: float, precision_adj: float = 1.0) -> Tuple[int, str, Dict]:
+        limits, reasons, debugs = self.engine.calculate([(self.hash, target, uploaded, time_left, elapsed, phase, precision_adj)], now)
+        return limits[0], reasons[0], debugs[0]
+
+    def reset(self):
+        self.engine.reset(self.hash)
+
+    def warm_start(self, target: float = 0):
+        self.engine.warm_start(self.hash, target)
+
+    def export_state(self) -> Dict[str, Any]:
+        return self.engine.export_state(self.hash)
+
+    def import_state(self, data: Dict[str, Any]):
+        self.engine.import_state(self.hash, data)
+
+class BatchPrecisionEngine:
+    """以结构化数组 (SoA) 保存全部种子的 Kalman/PID/量化/平滑状态，一次向量化运算算出整个 tick 的限速"""
+
+    def __init__(self, capacity: int = 64, ring: int = C.BATCH_RING):
+        self.ring = ring
+        self.index: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._pending: List[Tuple[int, float, float]] = []
+        self._wtab = np.array([[C.WINDOW_WEIGHTS[p].get(w, 0.25) for w in C.SPEED_WINDOWS] for p in PHASES])
+        self._alloc(max(8, capacity))
+
+    def _alloc(self, cap: int):
+        old = getattr(self, '_cap', 0)
+        def grow(name: str, fill: float, dtype=np.float64, shape: Tuple = ()):
+            arr = np.full((cap,) + shape, fill, dtype=dtype)
+            if old: arr[:old] = getattr(self, name)
+            setattr(self, name, arr)
+        for name, fill in (('k_speed', 0.0), ('k_accel', 0.0), ('p00', 1000.0), ('p01', 0.0), ('p10', 0.0),
+                           ('p11', 1000.0), ('k_last', 0.0), ('i_int', 0.0), ('i_err', 0.0), ('i_last', 0.0),
+                           ('i_out', 1.0), ('i_dfilt', 0.0), ('smooth', -1.0), ('w_tot', 0.0), ('target', 0.0)):
+            grow(name, fill)
+        grow('k_init', False, np.bool_); grow('i_init', False, np.bool_)
+        grow('w_n', 0, np.int64)
+        grow('w_ts', -np.inf, np.float64, (self.ring,))
+        grow('w_cum', 0.0, np.float64, (self.ring,))
+        self._cap = cap
+
+    def attach(self, h: str) -> BatchSlot:
+        if h not in self.index:
+            if self._free: i = self._free.pop()
+            else:
+                if self._size >= self._cap: self._alloc(self._cap * 2)
+                i = self._size; self._size += 1
+            self.index[h] = i
+            self._reset_row(i)
+        return BatchSlot(self, h)
+
+    def release(self, h: str):
+        i = self.index.pop(h, None)
+        if i is not None: self._free.append(i)
+
+    def _reset_row(self, i: int):
+        self.k_speed[i] = 0.0; self.k_accel[i] = 0.0; self.p00[i] = 1000.0; self.p01[i] = 0.0
+        self.p10[i] = 0.0; self.p11[i] = 1000.0; self.k_last[i] = 0.0; self.k_init[i] = False
+        self._reset_pid(i); self.smooth[i] = -1
+        self.w_n[i] = 0; self.w_ts[i] = -np.inf; self.w_cum[i] = 0.0; self.w_tot[i] = 0.0; self.target[i] = 0.0
+
+    def reset(self, h: str):
+        i = self.index.get(h)
+        if i is None: return
+        self._pending = [p for p in self._pending if p[0] != i]
+        self._reset_row(i)
+
+    def _reset_pid(self, i: int):
+        self.i_int[i] = 0.0; self.i_err[i] = 0.0; self.i_last[i] = 0.0; self.i_out[i] = 1.0
+        self.i_dfilt[i] = 0.0; self.i_init[i] = False
+
+    def warm_start(self, h: str, target: float = 0):
+        """与 PrecisionLimitController.warm_start 一致：沿用收敛状态，速度按目标之比缩放"""
+        i = self.index.get(h)
+        if i is None: return
+        self.flush()
+        if self.k_init[i]:
+            prev = self.target[i]
+            self.k_speed[i] *= target / prev if target > 0 and prev > 0 else 1.0
+            self.k_accel[i] = 0.0; self.p00[i] = self.p11[i] = C.WARM_KALMAN_P; self.p01[i] = self.p10[i] = 0.0
+        else:
+            self.k_speed[i] = 0.0; self.k_accel[i] = 0.0; self.p00[i] = 1000.0; self.p01[i] = 0.0
+            self.p10[i] = 0.0; self.p11[i] = 1000.0; self.k_init[i] = False
+        integral = self.i_int[i] * C.WARM_INTEGRAL_KEEP
+        self._reset_pid(i); self.i_int[i] = integral
+        self.smooth[i] = -1; self.w_n[i] = 0; self.w_tot[i] = 0.0
+        if target > 0: self.target[i] = target
+
+    def export_state(self, h: str) -> Dict[str, Any]:
+        i = self.index.get(h)
+        if i is None or not self.k_init[i]: return {}
+        return {'k': [float(a[i]) for a in (self.k_speed, self.k_accel, self.p00, self.p01, self.p10, self.p11)],
+                'i': float(self.i_int[i]), 't': float(self.target[i])}
+
+    def import_state(self, h: str, data: Dict[str, Any]):
+        i = self.index.get(h)
+        if i is None: return
+        try:
+            k = [float(x) for x in data['k']]
+            integral = float(data.get('i', 0)); target = float(data.get('t', 0))
+        except (KeyError, TypeError, ValueError): return
+        if len(k) != 6: return
+        self.k_speed[i], self.k_accel[i], self.p00[i], self.p01[i], self.p10[i], self.p11[i] = k
+        self.k_init[i] = True; self.k_last[i] = -1.0
+        self._reset_pid(i); self.i_int[i] = min(0.3, max(-0.3, integral))
+        self.target[i] = target
+
+    def push(self, h: str, now: float, speed: float):
+        i = self.index.get(h)
+        if i is not None: self._pending.append((i, now, speed))
+
+    def flush(self):
+        if not self._pending: return
+        pend = self._pending; self._pending = []
+        # 同一行可能积压多个样本（早退分支只记录不计算），按轮次展开，保证每轮行号唯一
+        rounds: List[List[Tuple[int, float, float]]] = []
+        seen: Dict[int, int] = {}
+        for p in pend:
+            k = seen.get(p[0], 0); seen[p[0]] = k + 1
+            if k == len(rounds): rounds.append([])
+            rounds[k].append(p)
+        for batch in rounds:
+            idx = np.fromiter((p[0] for p in batch), np.int64, len(batch))
+            now = np.fromiter((p[1] for p in batch), np.float64, len(batch))
+            z = np.fromiter((p[2] for p in batch), np.float64, len(batch))
+            self._kalman_update(idx, now, z)
+            slot = self.w_n[idx] % self.ring
+            self.w_tot[idx] += z
+            self.w_ts[idx, slot] = now; self.w_cum[idx, slot] = self.w_tot[idx]
+            self.w_n[idx] += 1
+
+    def _kalman_update(self, idx, now, z):
+        init = self.k_init[idx]
+        first = idx[~init]
+        self.k_speed[first] = z[~init]; self.k_last[first] = now[~init]; self.k_init[first] = True
+        dt = now - self.k_last[idx]
+        # 从数据库恢复的估计：先对齐时间基准
+        anchor = init & (self.k_last[idx] < 0)
+        self.k_last[idx[anchor]] = now[anchor]
+        m = init & ~anchor & (dt > 0.01)
+        if not m.any(): return
+        i = idx[m]; dt = dt[m]; z = z[m]
+        self.k_last[i] = now[m]
+        speed, accel = self.k_speed[i], self.k_accel[i]
+        p00, p01, p10, p11 = self.p00[i], self.p01[i], self.p10[i], self.p11[i]
+        pred = speed + accel * dt
+        p00p = p00 + dt * (p10 + p01) + dt * dt * p11 + C.KALMAN_Q_SPEED
+        p01p = p01 + dt * p11
+        p10p = p10 + dt * p11
+        p11p = p11 + C.KALMAN_Q_ACCEL
+        s = p00p + C.KALMAN_R
+        ok = np.abs(s) >= 1e-10
+        i = i[ok]; s = s[ok]
+        p00p, p01p, p10p, p11p, pred, z, accel = p00p[ok], p01p[ok], p10p[ok], p11p[ok], pred[ok], z[ok], accel[ok]
+        k0 = p00p / s; k1 = p10p / s
+        inn = z - pred
+        self.k_speed[i] = pred + k0 * inn
+        self.k_accel[i] = accel + k1 * inn
+        self.p00[i] = (1 - k0) * p00p
+        self.p01[i] = (1 - k0) * p01p
+        self.p10[i] = -k1 * p00p + p10p
+        self.p11[i] = -k1 * p01p + p11p
+
+    def _start(self, idx, n, now, window: float):
+        # 按行二分：每行最早的 age <= window 样本的绝对序号；环里多留一格给前缀和
+        lo = np.maximum(0, n - self.ring + 1); hi = n.copy()
+        while True:
+            m = lo < hi
+            if not m.any(): return lo
+            mid = (lo + hi) // 2
+            old = now - self.w_ts[idx, mid % self.ring] > window
+            lo = np.where(m & old, mid + 1, lo); hi = np.where(m & ~old, mid, hi)
+
+    def _prefix(self, idx, a):
+        # 样本 [0, a) 的累计和
+        return np.where(a > 0, self.w_cum[idx, (a - 1) % self.ring], 0.0)
+
+    def _windows(self, idx, now, phase):
+        n = self.w_n[idx]; total = self.w_tot[idx]
+        weighted = np.zeros(len(idx)); wsum = np.zeros(len(idx))
+        for j, window in enumerate(C.SPEED_WINDOWS):
+            a = self._start(idx, n, now, window)
+            cnt = n - a
+            has = cnt > 0
+            w = self._wtab[phase, j]
+            weighted += np.where(has, (total - self._prefix(idx, a)) / np.maximum(cnt, 1) * w, 0.0); wsum += np.where(has, w, 0.0)
+        weighted = np.where(wsum > 0, weighted / np.where(wsum > 0, wsum, 1), 0.0)
+
+        # 趋势：最近 10s 样本按时间先后二分，比较前后两半均值
+        a = self._start(idx, n, now, 10)
+        cnt = n - a; mid = cnt // 2
+        base = self._prefix(idx, a); split = self._prefix(idx, a + mid)
+        first = (split - base) / np.maximum(mid, 1)
+        second = (total - split) / np.maximum(cnt - mid, 1)
+        trend = np.where((cnt >= 5) & (np.abs(first) >= 1e-10), (second - first) / np.where(np.abs(first) >= 1e-10, first, 1), 0.0)
+        return weighted, trend
+
+    def calculate(self, rows: List[Tuple[str, float, int, float, float, str, float]], now: float) -> Tuple[List[int], List[str], List[Dict[str, Any]]]:
+        """rows: (hash, target, uploaded, time_left, elapsed, phase, precision_adj)"""
+        self.flush()
+        n = len(rows)
+        if n == 0: return [], [], []
+        idx = np.fromiter((self.index[r[0]] for r in rows), np.int64, n)
+        target = np.fromiter((r[1] for r in rows), np.float64, n)
+        uploaded = np.fromiter((r[2] for r in rows), np.float64, n)
+        tl = np.fromiter((r[3] for r in rows), np.float64, n)
+        elapsed = np.fromiter((r[4] for r in rows), np.float64, n)
+        phase = np.fromiter((PHASE_CODE.get(r[5], STEADY) for r in rows), np.int64, n)
+        adj = np.fromiter((r[6] for r in rows), np.float64, n)
+        nowv = np.full(n, now)
+
+        adjusted = target * adj
+        self.target[idx] = target
+        ks = self.k_speed[idx]; ka = self.k_accel[idx]
+        weighted, trend = self._windows(idx, nowv, phase)
+        current = np.where((phase == FINISH) & (weighted > 0), weighted, np.where(ks > 0, ks, weighted))
+        target_total = adjusted * (elapsed + tl)
+        pred_up = np.maximum(0, ks * tl + 0.5 * ka * tl * tl)
+        tt_ok = np.abs(target_total) >= 1e-10
+        pred = np.where(tt_ok, (uploaded + pred_up) / np.where(tt_ok, target_total, 1), 0.0)
+        need = np.maximum(0, target_total - uploaded)
+        live = tl > 0
+        required = np.where(live, need / np.where(live, tl, 1), 0.0)
+
+        pid = self._pid(idx[live], phase[live], target_total[live], uploaded[live], now)
+        pid_out = np.ones(n); pid_out[live] = pid
+
+        headroom = np.array([C.PID_PARAMS[p].get('headroom', 1.01) for p in PHASES])[phase]
+        progress = np.where(tt_ok, uploaded / np.where(tt_ok, target_total, 1), 0.0)
+        corr = np.where(pred > 1.002, np.maximum(0.8, 1 - (pred - 1) * 3), np.where(pred < 0.998, np.minimum(1.2, 1 + (1 - pred) * 3), 1.0))
+        steady_head = np.where(pred > 1.01, 1.0, headroom)
+
+        branch = np.select(
+            [~live, phase == FINISH, phase == STEADY, (phase == CATCH) & (required > adjusted * 5), phase == CATCH,
+             progress >= 1.0, progress >= 0.8, progress >= 0.5],
+            [B_REPORT, B_FINISH, B_STEADY, B_CATCH_OPEN, B_CATCH, B_W_OVER, B_W_FINE, B_W_WARM], B_W_OPEN)
+        raw = np.select(
+            [branch == B_FINISH, branch == B_STEADY, branch == B_CATCH, branch == B_W_OVER, branch == B_W_FINE, branch == B_W_WARM],
+            [required * pid_out * corr, required * steady_head * pid_out, required * headroom * pid_out,
+             np.full(n, float(C.MIN_LIMIT)), required * 1.01 * pid_out, required * 1.05], -1.0)
+        limit = np.where(raw >= 0, np.trunc(raw), -1.0)
+
+        limit = np.where(limit > 0, self._quantize(limit, phase, current, adjusted, trend), limit)
+        final = self._smooth(idx[live], limit[live], phase[live])
+        limit[live] = final
+
+        limits = limit.astype(np.int64).tolist()
+        reasons = [self._reason(int(b), float(r), float(p)) for b, r, p in zip(branch, required, progress)]
+        debugs = [{'predicted_ratio': float(pr), 'required_speed': float(rq), 'pid_output': float(po), 'final_limit': lm}
+                   if lv else {'predicted_ratio': float(pr)}
+                   for pr, rq, po, lm, lv in zip(pred, required, pid_out, limits, live)]
+        return limits, reasons, debugs
+
+    def _pid(self, idx, phase, setpoint, measured, now: float):
+        kp = np.array([C.PID_PARAMS[p]['kp'] for p in PHASES])[phase]
+        ki = np.array([C.PID_PARAMS[p]['ki'] for p in PHASES])[phase]
+        kd = np.array([C.PID_PARAMS[p]['kd'] for p in PHASES])[phase]
+        denom = np.maximum(setpoint, 1)
+        err = np.where(denom >= 1e-10, (setpoint - measured) / denom, 0.0)
+        out = np.ones(len(idx))
+        init = self.i_init[idx]
+        first = idx[~init]
+        self.i_err[first] = err[~init]; self.i_last[first] = now; self.i_init[first] = True
+        dt = now - self.i_last[idx]
+        hold = init & (dt <= 0.01)
+        out[hold] = self.i_out[idx[hold]]
+        m = init & (dt > 0.01)
+        if m.any():
+            i = idx[m]; e = err[m]; d = dt[m]
+            self.i_last[i] = now
+            integ = np.clip(self.i_int[i] + e * d, -0.3, 0.3)
+            self.i_int[i] = integ
+            dfilt = 0.3 * ((e - self.i_err[i]) / d) + 0.7 * self.i_dfilt[i]
+            self.i_dfilt[i] = dfilt
+            self.i_err[i] = e
+            o = np.clip(1.0 + kp[m] * e + ki[m] * integ + kd[m] * dfilt, 0.5, 2.0)
+            self.i_out[i] = o
+            out[m] = o
+        return out
+
+    def _quantize(self, limit, phase, current, adjusted, trend):
+        base = np.array([C.QUANT_STEPS.get(p, 1024) for p in PHASES])[phase]
+        ok = np.abs(adjusted) >= 1e-10
+        ratio = np.where(ok, current / np.where(ok, adjusted, 1), 1.0)
+        step = np.select([phase == FINISH, ratio > 1.2, ratio > 1.05, ratio > 0.8], [np.full_like(base, 256), base * 2, base, base // 2], base)
+        step = np.where(np.abs(trend) > 0.1, np.maximum(256, step // 2), step)
+        step = np.clip(step, 256, 8192).astype(np.int64)
+        q = np.floor((limit + step // 2) / step) * step
+        return np.maximum(C.MIN_LIMIT, q)
+
+    def _smooth(self, idx, new, phase):
+        prev = self.smooth[idx]
+        direct = (new <= 0) | (prev <= 0) | (phase == FINISH)
+        safe_prev = np.where(prev > 0, prev, 1)
+        change = np.abs(new - prev) / safe_prev
+        factor = np.where(change >= 0.5, 0.5, 0.3)
+        blended = np.where(change < 0.2, new, np.trunc((1 - factor) * prev + factor * new))
+        out = np.where(direct, new, blended)
+        self.smooth[idx] = out
+        return out
+
+    @staticmethod
+    def _reason(branch: int, required: float, progress: float) -> str:
+        if branch == B_REPORT: return "汇报中"
+        if branch == B_FINISH: return f"F:{required/1024:.0f}K"
+        if branch == B_STEADY: return f"S:{required/1024:.0f}K"
+        if branch == B_CATCH_OPEN: return "C:欠速放开"
+        if branch == B_CATCH: return f"C:{required/1024:.0f}K"
+        if branch == B_W_OVER: return f"W:超{(progress-1)*100:.0f}%"
+        if branch == B_W_FINE: return "W:精控"
+        if branch == B_W_WARM: return "W:温控"
+        return "W:预热"
@@ -0,0 +1,241 @@
+"""精度引擎基准测试: python -m src.bench [--sizes 100,1000,10000] [--baseline bench_baseline.json] [--save] [--batch] [--memory] [--db]"""
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from typing import Dict, List, Callable
+from .consts import C
+from .utils import get_phase
+from .model import TorrentState
+from .batch import BatchPrecisionEngine, NUMPY_AVAILABLE
+from .database import Database, _SAVE_STATE, _state_row
+
+HOT_PATH = ('record_speed', 'calculate', 'get_weighted_avg', 'kalman_update', 'get_avg_speeds')
+TICK_DT = 0.25
+WARMUP_TICKS = 240
+MEASURE_TICKS = 8
+MEMORY_TICKS = 1200  # 300s，灌满 SpeedTracker 的汇报窗口
+DB_LEGACY_ROWS = 200  # 逐行开连接的旧写法太慢，只抽样这么多行
+
+class FleetSim:
+    """合成种子群：每个种子有自己的汇报周期偏移和带噪声的上传速度"""
+
+    def __init__(self, n: int, seed: int = 42):
+        rnd = random.Random(seed)
+        self.now = time.time()
+        self.target = 50 * 1024 * 1024 / 8
+        self.states: List[TorrentState] = []
+        self.offsets: List[float] = []
+        self.speeds: List[float] = []
+        self.uploaded: List[float] = []
+        for i in range(n):
+            st = TorrentState(f"{i:040x}")
+            st.name = f"bench-{i}"
+            st.cycle_start = self.now - rnd.uniform(0, 1700)
+            st.cycle_synced = rnd.random() > 0.1
+            st.cycle_interval = 1800
+            self.states.append(st)
+            self.offsets.append(rnd.uniform(0, 1800))
+            self.speeds.append(self.target * rnd.uniform(0.6, 1.6))
+            self.uploaded.append(0.0)
+        self._rnd = rnd
+
+    def tl(self, i: int) -> float:
+        return 1800 - (self.now + self.offsets[i]) % 1800
+
+    def step(self):
+        self.now += TICK_DT
+        for i in range(len(self.states)):
+            self.speeds[i] = max(0.0, self.speeds[i] * (1 + self._rnd.gauss(0, 0.03)))
+            self.uploaded[i] += self.speeds[i] * TICK_DT
+
+    def feed(self):
+        now = self.now
+        for i, st in enumerate(self.states):
+            st.limit_controller.record_speed(now, self.speeds[i])
+            st.speed_tracker.record(now, int(self.uploaded[i]), 0, self.speeds[i], 0)
+
+def _time_calls(sim: FleetSim, name: str) -> float:
+    now = sim.now; states = sim.states; n = len(states)
+    calls: List[Callable[[], object]] = []
+    for i, st in enumerate(states):
+        lc = st.limit_controller
+        tl = sim.tl(i); phase = get_phase(tl, st.cycle_synced)
+        if name == 'record_speed': calls.append(lambda lc=lc, s=sim.speeds[i]: lc.record_speed(now, s))
+        elif name == 'kalman_update': calls.append(lambda k=lc.kalman, s=sim.speeds[i]: k.update(s, now))
+        elif name == 'get_weighted_avg': calls.append(lambda t=lc.speed_tracker, p=phase: t.get_weighted_avg(now, p))
+        elif name == 'get_avg_speeds': calls.append(lambda t=st.speed_tracker: t.get_avg_speeds(now, C.REANNOUNCE_SPEED_SAMPLES))
+        else:
+            elapsed = st.elapsed(now); up = int(sim.uploaded[i])
+            calls.append(lambda lc=lc, tl=tl, e=elapsed, up=up, p=phase: lc.calculate(sim.target, up, tl, e, p, now))
+    t0 = time.perf_counter_ns()
+    for fn in calls: fn()
+    return (time.perf_counter_ns() - t0) / max(1, n)
+
+def _tick(sim: FleetSim):
+    sim.step(); sim.feed()
+    now = sim.now
+    for i, st in enumerate(sim.states):
+        tl = sim.tl(i); phase = get_phase(tl, st.cycle_synced)
+        st.limit_controller.calculate(sim.target, int(sim.uploaded[i]), tl, st.elapsed(now), phase, now)
+        st.speed_tracker.get_avg_speeds(now, C.REANNOUNCE_SPEED_SAMPLES)
+
+def run_size(n: int) -> Dict[str, float]:
+    sim = FleetSim(n)
+    for _ in range(WARMUP_TICKS):
+        sim.step(); sim.feed()
+
+    ns: Dict[str, List[float]] = {k: [] for k in HOT_PATH}
+    for _ in range(MEASURE_TICKS):
+        sim.step()
+        for name in HOT_PATH: ns[name].append(_time_calls(sim, name))
+
+    tracemalloc.start()
+    alloc = []
+    for _ in range(3):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        _tick(sim)
+        alloc.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for _ in range(3): _tick(sim)
+    tick_ms = (time.perf_counter() - t0) / 3 * 1000
+
+    result = {f"{k}_ns": min(v) for k, v in ns.items()}
+    result['tick_ms'] = tick_ms
+    result['alloc_bytes_per_tick'] = sum(alloc) / len(alloc)
+    result['peak_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+def measure_memory(n: int) -> Dict[str, float]:
+    """每个受管种子的常驻内存：刚创建时与稳定运行 300s 之后"""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sim = FleetSim(n)
+    fresh = tracemalloc.get_traced_memory()[0] - base
+    for _ in range(MEMORY_TICKS):
+        sim.step(); sim.feed()
+    warm = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return {'state_bytes_fresh': fresh / n, 'state_bytes_warm': warm / n}
+
+def run_batch(n: int) -> Dict[str, float]:
+    """同一种子群分别走标量与批量引擎，比较单 tick 耗时与结果偏差"""
+    sim = FleetSim(n)
+    engine = BatchPrecisionEngine(capacity=n)
+    slots = [engine.attach(st.hash) for st in sim.states]
+    for _ in range(WARMUP_TICKS):
+        sim.step(); sim.feed()
+        for i, slot in enumerate(slots): slot.record_speed(sim.now, sim.speeds[i])
+    scalar_ns = []; batch_ns = []; mismatch = 0; max_rel = 0.0
+    for _ in range(MEASURE_TICKS):
+        sim.step(); sim.feed()
+        now = sim.now; rows = []
+        for i, slot in enumerate(slots): slot.record_speed(now, sim.speeds[i])
+        t0 = time.perf_counter_ns(); expect = []
+        for i, st in enumerate(sim.states):
+            tl = sim.tl(i); phase = get_phase(tl, st.cycle_synced); up = int(sim.uploaded[i])
+            expect.append(st.limit_controller.calculate(sim.target, up, tl, st.elapsed(now), phase, now)[0])
+            rows.append((st.hash, sim.target, up, tl, st.elapsed(now), phase, 1.0))
+        scalar_ns.append(time.perf_counter_ns() - t0)
+        t0 = time.perf_counter_ns()
+        limits = engine.calculate(rows, now)[0]
+        batch_ns.append(time.perf_counter_ns() - t0)
+        for a, b in zip(expect, limits):
+            if a == b: continue
+            mismatch += 1
+            if a > 0 and b > 0: max_rel = max(max_rel, abs(a - b) / a)
+    return {'scalar_tick_ms': min(scalar_ns) / 1e6, 'batch_tick_ms': min(batch_ns) / 1e6,
+            'batch_mismatch': mismatch, 'batch_max_rel': max_rel}
+
+def run_db(n: int) -> Dict[str, float]:
+    """整批保存 n 个种子状态的耗时，对比逐行提交与旧的每行一个连接"""
+    sim = FleetSim(n)
+    tmp = tempfile.mkdtemp(prefix="qsl-bench-")
+    try:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.save_torrent_states(sim.states)  # 预热：表里已有同样的行，之后都是覆盖写
+        t0 = time.perf_counter()
+        db.save_torrent_states(sim.states)
+        bulk = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for st in sim.states: db.save_torrent_state(st)
+        single = time.perf_counter() - t0
+        db.close()
+        path = os.path.join(tmp, 'legacy.db')
+        Database(path).close()
+        conn = sqlite3.connect(path); conn.execute('PRAGMA journal_mode=DELETE'); conn.close()
+        rows = sim.states[:DB_LEGACY_ROWS]
+        t0 = time.perf_counter()
+        for st in rows:
+            conn = sqlite3.connect(path)
+            conn.execute(_SAVE_STATE, _state_row(st, sim.now)); conn.commit(); conn.close()
+        legacy = (time.perf_counter() - t0) / len(rows) * n
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {'db_bulk_ms': bulk * 1000, 'db_single_ms': single * 1000, 'db_legacy_ms': legacy * 1000}
+
+def check_regression(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    failures = []
+    for size, res in results.items():
+        base = baseline.get(size, {})
+        for key, value in res.items():
+            if not key.endswith('_ns') or key not in base or base[key] <= 0: continue
+            if value > base[key] * (1 + tolerance):
+                failures.append(f"n={size} {key}: {value:.0f}ns > {base[key]:.0f}ns × {1 + tolerance:.2f}")
+    return failures
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.bench")
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save", action="store_true", help="将本次结果写为基线")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--batch", action="store_true", help="对比 NumPy 批量引擎")
+    parser.add_argument("--memory", action="store_true", help="统计每个种子的内存占用")
+    parser.add_argument("--db", action="store_true", help="测量整批保存种子状态的耗时")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    for n in [int(x) for x in args.sizes.split(',') if x.strip()]:
+        results[str(n)] = run_size(n)
+        if not args.json:
+            r = results[str(n)]
+            calls = " ".join(f"{k}={r[k + '_ns']:.0f}ns" for k in HOT_PATH)
+            print(f"n={n:<6} {calls} tick={r['tick_ms']:.1f}ms alloc/tick={r['alloc_bytes_per_tick'] / 1024:.0f}KiB rss={r['peak_rss_kib'] / 1024:.0f}MiB")
+        if args.batch and NUMPY_AVAILABLE:
+            r = results[str(n)]; r.update(run_batch(n))
+            if not args.json:
+                print(f"         标量={r['scalar_tick_ms']:.2f}ms 批量={r['batch_tick_ms']:.2f}ms 偏差={r['batch_mismatch']}/{n * MEASURE_TICKS} max_rel={r['batch_max_rel']:.2e}")
+        if args.memory:
+            r = results[str(n)]; r.update(measure_memory(n))
+            if not args.json:
+                print(f"         内存/种子 新建={r['state_bytes_fresh'] / 1024:.1f}KiB 运行300s={r['state_bytes_warm'] / 1024:.1f}KiB")
+        if args.db:
+            r = results[str(n)]; r.update(run_db(n))
+            if not args.json:
+                print(f"         数据库 整批={r['db_bulk_ms']:.1f}ms 逐行提交={r['db_single_ms']:.1f}ms 每行一连接(估算)={r['db_legacy_ms']:.0f}ms")
+    if args.json: print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.baseline, 'w') as f: json.dump(results, f, indent=2)
+        return 0
+    try:
+        with open(args.baseline) as f: baseline = json.load(f)
+    except (OSError, ValueError): return 0
+    failures = check_regression(results, baseline, args.tolerance)
+    for line in failures: print(f"❌ 性能回退 {line}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
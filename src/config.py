@@ -1,9 +1,45 @@
 import os
+import copy
 import json
-from dataclasses import dataclass
-from typing import Optional, Tuple
+from dataclasses import dataclass, field, replace
+from typing import Optional, Tuple, List
+from .consts import C
 from .database import Database
 
+# 多实例模式下 hosts 条目可覆盖的字段
+HOST_KEYS = ('name', 'host', 'username', 'password', 'target_speed_kib', 'safety_margin', 'max_physical_speed_kib',
+             'api_rate_limit', 'target_tracker_keyword', 'exclude_tracker_keyword', 'enable_dl_limit',
+             'enable_reannounce_opt', 'use_sync_maindata')
+
+# 可由调参配置 (python -m src.tune 生成) 覆盖的常量
+TUNABLE = ('PID_PARAMS', 'QUANT_STEPS', 'KALMAN_Q_SPEED', 'KALMAN_Q_ACCEL', 'KALMAN_R')
+_TUNING_DEFAULTS = {k: copy.deepcopy(getattr(C, k)) for k in TUNABLE}
+
+def default_tuning() -> dict:
+    return copy.deepcopy(_TUNING_DEFAULTS)
+
+def load_tuning(path: str) -> dict:
+    """读取调参配置并合并到默认值上，缺省的键沿用内置常量"""
+    with open(path, 'r', encoding='utf-8') as f: d = json.load(f)
+    t = default_tuning()
+    for phase, params in (d.get('PID_PARAMS') or {}).items():
+        if phase not in t['PID_PARAMS']: raise ValueError(f"未知阶段: {phase}")
+        for k, v in params.items():
+            if k not in t['PID_PARAMS'][phase] or float(v) < 0: raise ValueError(f"PID_PARAMS.{phase}.{k} 无效")
+            t['PID_PARAMS'][phase][k] = float(v)
+    for phase, step in (d.get('QUANT_STEPS') or {}).items():
+        if phase not in t['QUANT_STEPS'] or int(step) < 256: raise ValueError(f"QUANT_STEPS.{phase} 无效")
+        t['QUANT_STEPS'][phase] = int(step)
+    for k in ('KALMAN_Q_SPEED', 'KALMAN_Q_ACCEL', 'KALMAN_R'):
+        if k in d:
+            if float(d[k]) <= 0: raise ValueError(f"{k} 必须为正数")
+            t[k] = float(d[k])
+    return t
+
+def apply_tuning(tuning: dict):
+    """将调参结果写入 C；空字典恢复内置常量"""
+    for k in TUNABLE: setattr(C, k, copy.deepcopy(tuning.get(k, _TUNING_DEFAULTS[k])))
+
 @dataclass
 class Config:
     host: str
@@ -23,6 +59,11 @@ class Config:
     peer_list_enabled: bool = True
     enable_dl_limit: bool = True
     enable_reannounce_opt: bool = True
+    use_sync_maindata: bool = True
+    record_path: str = ""
+    batch_engine: bool = False
+    tuning_profile: str = ""
+    tuning: dict = field(default_factory=dict)
     
     # === 新增模块开关 ===
     flexget_enabled: bool = False
@@ -30,6 +71,11 @@ class Config:
     autoremove_enabled: bool = False
     autoremove_interval_sec: int = 1800
     
+    # === 多实例 ===
+    name: str = ""
+    db_path: str = C.DB_PATH
+    hosts: List[dict] = field(default_factory=list)
+    
     _mtime: float = 0
     
     @property
@@ -40,12 +86,29 @@ class Config:
     def max_physical_bytes(self) -> int:
         return (self.max_physical_speed_kib or 0) * 1024
     
+    @property
+    def multi_host(self) -> bool:
+        return len(self.hosts) > 0
+    
+    def host_configs(self) -> List['Config']:
+        """展开为每个 qB 实例一份配置；多实例模式下顶层 max_physical_speed_kib 为全机共享预算"""
+        if not self.hosts: return [self]
+        result = []
+        for i, entry in enumerate(self.hosts):
+            overrides = {k: type(getattr(self, k))(v) for k, v in entry.items() if k in HOST_KEYS}
+            overrides.setdefault('name', f"qb{i + 1}")
+            overrides.setdefault('max_physical_speed_kib', 0)
+            result.append(replace(self, hosts=[], **overrides))
+        return result
+    
     @classmethod
     def load(cls, path: str, db: 'Database' = None) -> Tuple[Optional['Config'], Optional[str]]:
         try:
             mtime = os.path.getmtime(path)
             with open(path, 'r', encoding='utf-8') as f:
                 d = json.load(f)
+            tuning_profile = str(d.get('tuning_profile', '')).strip()
+            tuning_path = os.path.join(os.path.dirname(os.path.abspath(path)), tuning_profile) if tuning_profile else ''
             
             cfg = cls(
                 host=str(d.get('host', '')).strip(),
@@ -65,6 +128,11 @@ class Config:
                 peer_list_enabled=bool(d.get('peer_list_enabled', True)),
                 enable_dl_limit=bool(d.get('enable_dl_limit', True)),
                 enable_reannounce_opt=bool(d.get('enable_reannounce_opt', True)),
+                use_sync_maindata=bool(d.get('use_sync_maindata', True)),
+                record_path=str(d.get('record_path', '')).strip(),
+                batch_engine=bool(d.get('batch_engine', False)),
+                tuning_profile=tuning_profile,
+                tuning=load_tuning(tuning_path) if tuning_path else {},
                 
                 # === 新增参数 ===
                 flexget_enabled=bool(d.get('flexget_enabled', False)),
@@ -72,6 +140,10 @@ class Config:
                 autoremove_enabled=bool(d.get('autoremove_enabled', False)),
                 autoremove_interval_sec=int(d.get('autoremove_interval_sec', 1800)),
                 
+                name=str(d.get('name', '')).strip(),
+                db_path=str(d.get('db_path', C.DB_PATH)).strip() or C.DB_PATH,
+                hosts=[h for h in (d.get('hosts') or []) if isinstance(h, dict) and h.get('host')],
+                
                 _mtime=mtime
             )
             
@@ -34,11 +34,19 @@ class C:
     
     PRECISION_PERFECT = 0.001
     PRECISION_GOOD = 0.005
+    # 精度模型：按 (tracker, 阶段, 体积档) 学习修正系数
+    PRECISION_SIZE_BUCKETS_GIB = [1, 4, 16, 64]
+    PRECISION_EWMA_ALPHA = 0.1
+    PRECISION_MIN_SAMPLES = 3
     
     SPEED_PROTECT_RATIO = 2.5
     SPEED_PROTECT_LIMIT = 1.3
     PROGRESS_PROTECT = 0.90
     MIN_LIMIT = 4096
+    # 整机带宽分配：首轮配额不超过当前速度 × GROWTH (至少 MIN_GRANT)；未到期种子的配额变化超过 REPUSH_RATIO 才重新下发
+    ALLOC_GROWTH = 1.5
+    ALLOC_MIN_GRANT = 512 * 1024
+    ALLOC_REPUSH_RATIO = 0.1
     
     # PID 参数 (你的核心逻辑参数)
     PID_PARAMS = {
@@ -53,6 +61,9 @@ class C:
     KALMAN_Q_SPEED = 0.1
     KALMAN_Q_ACCEL = 0.05
     KALMAN_R = 0.5
+    # 新周期热启动：Kalman 协方差重置值、PID 积分保留比例
+    WARM_KALMAN_P = 100.0
+    WARM_INTEGRAL_KEEP = 0.5
     
     SPEED_WINDOWS = [5, 15, 30, 60]
     WINDOW_WEIGHTS = {
@@ -64,17 +75,30 @@ class C:
     
     MAX_REANNOUNCE = 86400
     PROPS_CACHE = {"finish": 0.2, "steady": 0.5, "catch": 1.0, "warmup": 2.0}
+    PROPS_STALE_WEIGHT = 30
+    PROPS_STALE_CAP = 10
     LOG_INTERVAL = 20
     CONFIG_CHECK = 30
     ANNOUNCE_INTERVAL_NEW = 1800
     ANNOUNCE_INTERVAL_WEEK = 2700
     ANNOUNCE_INTERVAL_OLD = 3600
+    ANNOUNCE_AGE_BANDS_DAYS = [7, 30]  # 对应 NEW / WEEK / OLD
+    # 汇报间隔模型：汇报后 SAMPLE_WINDOW 秒内的 props 才作为样本，可信后只在每次汇报后 VERIFY_DELAY 秒校验一次
+    ANNOUNCE_MODEL_MIN_SAMPLES = 3
+    ANNOUNCE_MODEL_TOLERANCE = 15
+    ANNOUNCE_MODEL_SAMPLE_WINDOW = 120
+    ANNOUNCE_MODEL_VERIFY_DELAY = 5
     SPEED_LIMIT = 50 * 1024 * 1024
     
-    DL_LIMIT_MIN_TIME = 20
-    DL_LIMIT_BUFFER = 30
     DL_LIMIT_MIN = 512
-    DL_LIMIT_ADJUST_BUFFER = 60
+    DL_LIMIT_MAX = 512000
+    # 下载限速：按预测完成时刻计算，目标完成时刻留 PREDICT_MARGIN 秒余量；变化不超过 HYSTERESIS 时保持原值
+    DL_PREDICT_MARGIN = 20
+    DL_DRAIN_MIN = 0.2
+    DL_LIMIT_HYSTERESIS = 0.15
+    DL_KALMAN_Q_SPEED = 0.05
+    DL_KALMAN_Q_ACCEL = 0.01
+    DL_KALMAN_R = 1.0
     
     REANNOUNCE_WAIT_LIMIT = 5120
     REANNOUNCE_MIN_INTERVAL = 900
@@ -85,5 +109,40 @@ class C:
     
     DB_PATH = "qbit_smart_limit.db"
     DB_SAVE_INTERVAL = 180
+    DB_BATCH_SIZE = 500
+    # 周期历史：明细保留天数、小时汇总保留天数 (天汇总不清理)
+    HISTORY_RAW_DAYS = 30
+    HISTORY_HOURLY_DAYS = 180
+    # 数据库维护：清理超过 STATE_PRUNE_DAYS 未出现的种子状态、过期历史，增量 vacuum
+    DB_MAINTENANCE_INTERVAL = 3600
+    STATE_PRUNE_DAYS = 30
     TG_POLL_INTERVAL = 2
     COOKIE_CHECK_INTERVAL = 3600
+    
+    # sync/maindata 增量同步
+    SYNC_ACTIVE_STATES = frozenset({'downloading', 'uploading', 'forcedUP', 'forcedDL', 'metaDL',
+                                    'checkingUP', 'checkingDL', 'checkingResumeData', 'moving'})
+    SYNC_STATS_INTERVAL = 300
+    
+    # 按种子截止时间调度: (剩余时间上界, 评估间隔)
+    SCHED_LADDER = [(5, 0.15), (15, 0.25), (30, 0.4), (90, 0.8), (300, 1.5)]
+    SCHED_MAX_INTERVAL = 5.0
+    SCHED_MIN_SLEEP = 0.1
+    
+    # 限速下发执行器
+    ACTUATOR_WORKERS = 4
+    ACTUATOR_RETRIES = 2
+    ACTUATOR_RETRY_DELAY = 0.2
+    ACTUATOR_TIMEOUT = 2.0
+    ACTUATOR_COALESCE_TTL = 2.0
+    # 延迟补偿：预计生效延迟低于 MIN 时不补偿 (回放与本机直连)，高于 MAX 时截断
+    LATENCY_MIN_LEAD = 0.02
+    LATENCY_MAX_LEAD = 2.0
+    
+    # 性能监控
+    PERF_BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 150, 250, 500, 1000, 2500, 5000]
+    PERF_DUMP = os.path.join(BASE_DIR, "perf.json")
+    PERF_DUMP_INTERVAL = 60
+    
+    # NumPy 批量引擎: 每个种子保留的速度样本数 (≥ 60s 窗口 / 最小评估间隔)
+    BATCH_RING = 512
@@ -1,48 +1,120 @@
 # src/controller.py
 import os, sys, time, signal, threading, queue, logging
 from collections import deque
-from typing import Optional, Dict, List, Any, Tuple
+from typing import Optional, Dict, List, Any, Tuple, Callable
 
 import qbittorrentapi
 from qbittorrentapi.exceptions import APIConnectionError, LoginFailed
 
 from .consts import C
-from .utils import logger, log_buffer, setup_logging, LoggerWrapper, wall_time, fmt_speed, safe_div
-from .config import Config
-from .database import Database
-from .model import TorrentState, Stats
-from .algorithms import _precision_tracker
+from .utils import logger, log_buffer, setup_logging, LoggerWrapper, wall_time, get_clock, fmt_speed, safe_div, tracker_host
+from .config import Config, apply_tuning
+from .database import Database, DbWriter, state_rows, state_dict
+from .model import TorrentState, Stats, BandwidthBudget
+from .algorithms import PrecisionModel, AnnounceModel
 from .helper_bot import Notifier
 from .helper_web import U2WebHelper, BS4_AVAILABLE
-from .logic import DownloadLimiter, ReannounceOptimizer
+from .logic import DownloadLimiter, ReannounceOptimizer, UplinkAllocator
+from .sync import MainDataSync
+from .actuator import LimitActuator
+from .perf import PerfMonitor, RttEstimator, dump_perf
+from .replay import TickRecorder
+from .batch import BatchPrecisionEngine, NUMPY_AVAILABLE
+from .scheduler import DeadlineScheduler, PropsRefreshQueue, eval_interval
 from .workers import NativeRssWorker, AutoRemoveWorker
 
 class Controller:
     ACTIVE = frozenset({'downloading', 'seeding', 'uploading', 'forcedUP', 'stalledUP', 
                         'stalledDL', 'checkingUP', 'forcedDL', 'checkingDL', 'metaDL'})
     
-    def __init__(self, path: str):
+    def __init__(self, path: str, parent: Optional['Controller'] = None, host_cfg: Optional[Config] = None):
         global logger
-        self.db = Database()
-        cfg, err = Config.load(path, self.db)
-        if err:
-            print(f"❌ 配置错误: {err}")
-            sys.exit(1)
-        self.config = cfg
         self.config_path = path
+        self.parent = parent
+        self.children: List['Controller'] = []
         self.last_config_check = wall_time()
         
-        logger = LoggerWrapper(setup_logging(cfg.log_level), log_buffer)
+        if parent is None:
+            cfg, err = Config.load(path)
+            if not err:
+                self.db = Database(cfg.db_path)
+                cfg, err = Config.load(path, self.db)
+            if err:
+                print(f"❌ 配置错误: {err}")
+                sys.exit(1)
+            self.root_config = cfg
+            host_cfgs = cfg.host_configs()
+            self.config = host_cfgs[0]
+            logger = LoggerWrapper(setup_logging(cfg.log_level), log_buffer)
+            self.writer = DbWriter(self.db, self._on_write_failed)
+            apply_tuning(cfg.tuning)
+            if cfg.tuning: logger.info(f"🎛️ 已加载调参配置: {cfg.tuning_profile}")
+        else:
+            self.db = parent.db
+            self.writer = parent.writer
+            self.root_config = parent.root_config
+            self.config = host_cfg
+        self.name = self.config.name or self.config.host
         
         self.client: Optional[qbittorrentapi.Client] = None
         self.qb_version = ""
         self.states: Dict[str, TorrentState] = {}
-        self.stats = Stats()
         
+        self.running = True
+        self.modified_up: set = set()
+        self.modified_dl: set = set()
+        self._api_times: deque = deque(maxlen=200)
+        self.sync = MainDataSync()
+        self.scheduler = DeadlineScheduler()
+        self.props_queue = PropsRefreshQueue()
+        self.actuator = LimitActuator()
+        self.perf = PerfMonitor()
+        self.recorder: Optional[TickRecorder] = None
+        self.cycle_listeners: List[Callable[[dict], None]] = []
+        self.batch: Optional[BatchPrecisionEngine] = None
+        self._batch_pending: Optional[List[tuple]] = None
+        self._alloc_pending: Optional[List[tuple]] = None  # 本 tick 启用整机分配时收集到期种子的限速
+        if self.config.batch_engine:
+            if NUMPY_AVAILABLE: self.batch = BatchPrecisionEngine()
+            else: logger.warning("⚠️ NumPy 未安装，批量引擎已禁用")
+        self._last_sync_log = 0.0
+        self._last_perf_dump = 0.0
+        self.perf_dump = C.PERF_DUMP
+        # 读取往返与本地处理耗时，用于估计采样到限速生效的延迟
+        self.read_rtt = RttEstimator()
+        self.proc_lag = RttEstimator()
+        self._apply_at = 0.0
+        self._lead = 0.0
+        self._last_db_save = wall_time()
+        self._last_maintenance = wall_time()
+        self._removed: set = set()  # 已从 qB 删除、等待移出 states 的种子，不再回写
+        self._last_cookie_check = 0
+        
+        if parent is not None:
+            # 子实例共享主控制器的统计、通知、U2 助手与带宽预算
+            self.stats = parent.stats
+            self.precision = parent.precision
+            self.announce_model = parent.announce_model
+            self._preload = parent._preload
+            self.notifier = parent.notifier
+            self.u2_helper = parent.u2_helper
+            self.u2_enabled = parent.u2_enabled
+            self.budget = parent.budget
+            self._pending_tid_searches = parent._pending_tid_searches
+            return
+        
+        self.stats = Stats()
         db_stats = self.db.load_stats()
         if db_stats:
             self.stats.load_from_db(db_stats)
             logger.info(f"📦 已从数据库恢复统计: {self.stats.total} 个周期")
+        self.precision = PrecisionModel()
+        self.precision.load(self.db.load_precision_model())
+        self.announce_model = AnnounceModel()
+        self.announce_model.load(self.db.load_announce_model())
+        # 一次读出全部种子状态，_process 遇到新 hash 时直接取用，首个 tick 不再逐个查库
+        self._preload: Dict[str, dict] = self.db.load_all_torrent_states()
+        if self._preload: logger.info(f"📦 已预载 {len(self._preload)} 个种子状态")
         
         # 初始化 TG Bot (Notifier) 并传入 self
         self.notifier = Notifier(cfg.telegram_bot_token, cfg.telegram_chat_id, self)
@@ -56,25 +128,26 @@ class Controller:
             else:
                 logger.warning("⚠️ BeautifulSoup 未安装，U2功能已禁用")
         
-        self.running = True
-        self.modified_up: set = set()
-        self.modified_dl: set = set()
-        self._api_times: deque = deque(maxlen=200)
+        self.budget = BandwidthBudget(cfg.max_physical_bytes if cfg.multi_host else 0)
+        self._pending_tid_searches: queue.Queue = queue.Queue()
+        self.children = [Controller(path, self, hc) for hc in host_cfgs[1:]]
         
         self.rss_worker = NativeRssWorker(self)
         self.autoremove_worker = AutoRemoveWorker(self)
         self.rss_worker.start()
         self.autoremove_worker.start()
         
-        self._pending_tid_searches: queue.Queue = queue.Queue()
         threading.Thread(target=self._tid_search_worker, daemon=True, name="TID-Search").start()
         
-        self._last_db_save = wall_time()
-        self._last_cookie_check = 0
-        
         signal.signal(signal.SIGINT, lambda *_: self._shutdown())
         signal.signal(signal.SIGTERM, lambda *_: self._shutdown())
     
+    def all_states(self) -> Dict[str, TorrentState]:
+        if not self.children: return self.states
+        merged = dict(self.states)
+        for child in self.children: merged.update(child.states)
+        return merged
+    
     def _tid_search_worker(self):
         while self.running:
             try:
@@ -88,7 +161,6 @@ class Controller:
                         state.publish_time = publish_time
                         state.promotion = promo
                         state.tid_searched = True
-                        self.db.save_torrent_state(state)
                     else:
                         state.tid_not_found = True
                         state.tid_searched = True
@@ -97,40 +169,113 @@ class Controller:
     
     def _shutdown(self):
         logger.info("🛑 正在停止服务...")
-        self.running = False
-        self._save_all_to_db()
+        hosts = [self] + self.children
+        for c in hosts: c.running = False
+        for c in hosts: c._save_all_to_db()
+        self.writer.close()
         if hasattr(self.notifier, 'shutdown_report'):
             self.notifier.shutdown_report()
-        if self.client:
-            try:
-                if self.modified_up: self.client.torrents_set_upload_limit(-1, list(self.modified_up))
-                if self.modified_dl: self.client.torrents_set_download_limit(-1, list(self.modified_dl))
-            except: pass
+        for c in hosts:
+            c._release_limits()
+            if c.recorder: c.recorder.close()
         if self.u2_helper: self.u2_helper.close()
         self.notifier.close()
+        self.db.close()
         sys.exit(0)
     
+    def delete_state(self, h: str):
+        """种子已从 qB 删除：删掉库里与停放中的状态；仍在 states 里的，移出时不再回写"""
+        if h in self.states: self._removed.add(h)
+        self._preload.pop(h, None)
+        self.writer.submit('delete_torrent_state', h)
+    
+    def _known_hashes(self) -> Optional[List[str]]:
+        """qB 中的全部种子：优先用 sync 增量表 (含不活跃的)，否则全量 torrents_info；失败返回 None"""
+        if self.config.use_sync_maindata and self.sync.torrents: return list(self.sync.torrents)
+        try: return [t.hash for t in self.client.torrents_info()]
+        except Exception: return None
+    
+    def _release_limits(self):
+        self.actuator.close()
+        if not self.client: return
+        try:
+            if self.modified_up: self.client.torrents_set_upload_limit(-1, list(self.modified_up))
+            if self.modified_dl: self.client.torrents_set_download_limit(-1, list(self.modified_dl))
+        except: pass
+    
     def _save_all_to_db(self):
+        # 只把变化过的行快照进写队列，由 DB-Writer 线程落盘，主循环不等磁盘
         try:
-            for state in self.states.values(): self.db.save_torrent_state(state)
-            self.db.save_stats(self.stats)
-            logger.debug("💾 状态已保存到数据库")
+            dirty = []
+            for state in list(self.states.values()):
+                if state.hash in self._removed: continue
+                key = state.persist_key()
+                if key != state.saved_key: state.saved_key = key; dirty.append(state)
+            rows = state_rows(dirty)
+            if self.parent is None:
+                # 停放中的种子写入失败后 saved_key 被清空，用停放时的行重新入队
+                for parked in list(self._preload.values()):
+                    if 'row' in parked and parked['saved_key'] is None:
+                        parked['saved_key'] = parked['key']; rows.append(parked['row'])
+            if rows: self.writer.submit('save_state_rows', rows)
+            if self.stats.dirty: self.writer.submit('save_stats', self.stats.snapshot())
+            rows = self.precision.dirty_rows()
+            if rows: self.writer.submit('save_precision_model', rows)
+            rows = self.announce_model.dirty_rows()
+            if rows: self.writer.submit('save_announce_model', rows)
+            logger.debug(f"💾 {len(rows)}/{len(self.states)} 个种子状态已加入写队列")
         except Exception as e: logger.error(f"保存数据库失败: {e}")
     
+    def _on_write_failed(self, kind: str, args: tuple):
+        # DB-Writer 线程回调：写入失败的数据重新标记为脏，下一轮保存 (含退出时) 再次入队
+        if kind == 'save_state_rows':
+            failed = {row[0] for row in args[0]}
+            for c in [self] + self.children:
+                for h in failed:
+                    state = c.states.get(h)
+                    if state: state.saved_key = None
+            for h in failed:
+                parked = self._preload.get(h)
+                if parked: parked['saved_key'] = None
+        elif kind == 'save_stats': self.stats.dirty = True
+    
+    def _apply_config(self, cfg: Config):
+        host_cfgs = cfg.host_configs()
+        if len(host_cfgs) != len(self.children) + 1:
+            logger.warning("⚠️ hosts 数量变化需重启生效")
+            return
+        self.root_config = cfg
+        self.config = host_cfgs[0]
+        apply_tuning(cfg.tuning)
+        self.budget.limit = cfg.max_physical_bytes if cfg.multi_host else 0
+        for child, hc in zip(self.children, host_cfgs[1:]):
+            child.root_config = cfg; child.config = hc
+        logger.info("📝 配置已重新加载")
+    
     def _check_config(self, now: float):
         if now - self.last_config_check < C.CONFIG_CHECK: return
         self.last_config_check = now
+        if now - self._last_db_save > C.DB_SAVE_INTERVAL:
+            self._save_all_to_db()
+            self._last_db_save = now
+        if self.parent is not None: return
+        if now - self._last_maintenance > C.DB_MAINTENANCE_INTERVAL:
+            self._last_maintenance = now
+            # qB 里仍存在的种子 (不限活跃) 与停放中的状态都算见过；任一实例取不到列表时本轮不清理
+            seen = {h for h, p in list(self._preload.items()) if 'row' in p}
+            complete = True
+            for c in [self] + self.children:
+                seen.update(c.states)
+                known = c._known_hashes()
+                if known is None: complete = False
+                else: seen.update(known)
+            self.writer.submit('maintain', list(seen), now, complete)
         try:
             mtime = os.path.getmtime(self.config_path)
-            if mtime > self.config._mtime:
+            if mtime > self.root_config._mtime:
                 new_cfg, err = Config.load(self.config_path, self.db)
-                if not err:
-                    self.config = new_cfg
-                    logger.info("📝 配置已重新加载")
+                if not err: self._apply_config(new_cfg)
         except: pass
-        if now - self._last_db_save > C.DB_SAVE_INTERVAL:
-            self._save_all_to_db()
-            self._last_db_save = now
         if self.u2_helper and now - self._last_cookie_check > C.COOKIE_CHECK_INTERVAL:
             self._last_cookie_check = now
             valid, msg = self.u2_helper.check_cookie_valid()
@@ -141,10 +286,13 @@ class Controller:
     def _connect(self):
         for i in range(5):
             try:
-                self.client = qbittorrentapi.Client(host=self.config.host, username=self.config.username, password=self.config.password, VERIFY_WEBUI_CERTIFICATE=False, REQUESTS_ARGS={'timeout': (5, 15)})
+                self.client = qbittorrentapi.Client(host=self.config.host, username=self.config.username, password=self.config.password, VERIFY_WEBUI_CERTIFICATE=False, REQUESTS_ARGS={'timeout': (5, 15)},
+                                                    HTTPADAPTER_ARGS={'pool_connections': C.ACTUATOR_WORKERS, 'pool_maxsize': C.ACTUATOR_WORKERS + 2})
                 self.client.auth_log_in()
                 self.qb_version = self.client.app.version
-                logger.info(f"✅ 已连接 qBittorrent {self.qb_version}")
+                self.sync.reset(self.client)
+                self.actuator.set_client(self.client)
+                logger.info(f"✅ 已连接 qBittorrent {self.qb_version} ({self.name})")
                 return
             except LoginFailed:
                 logger.error("❌ 登录失败，请检查用户名密码")
@@ -153,6 +301,20 @@ class Controller:
                 if i < 4: time.sleep(2 ** i)
                 else: raise
     
+    def _fetch_torrents(self, now: float) -> List[Any]:
+        if not self.config.use_sync_maindata:
+            return self.client.torrents_info(status_filter='active')
+        try: torrents = self.sync.poll()
+        except APIConnectionError: raise
+        except Exception as e:
+            logger.warning(f"⚠️ sync_maindata 失败，回退全量: {e}")
+            self.sync.reset()
+            return self.client.torrents_info(status_filter='active')
+        if now - self._last_sync_log > C.SYNC_STATS_INTERVAL:
+            self._last_sync_log = now
+            logger.debug(f"📡 {self.sync.stats.summary()} | props 获取/跳过 {self.props_queue.summary()} | 限速 {self.actuator.summary()} | 读取 srtt={self.read_rtt.srtt * 1000:.1f}ms 补偿={self._lead * 1000:.0f}ms")
+        return torrents
+    
     def _api_ok(self, now: float) -> bool:
         if self.config.api_rate_limit <= 0: return True
         while self._api_times and now - self._api_times[0] > 1: self._api_times.popleft()
@@ -160,17 +322,55 @@ class Controller:
         self._api_times.append(now)
         return True
     
-    def _get_props(self, h: str, state: TorrentState, now: float, force: bool = False) -> Optional[dict]:
-        phase = state.get_phase(now)
-        cache = C.PROPS_CACHE.get(phase, 1.0)
-        if not force and state.last_props > 0 and now - state.last_props < cache: return None
+    def _get_props(self, h: str, state: Optional[TorrentState], now: float, force: bool = False) -> Optional[dict]:
+        if state is not None:
+            phase = state.get_phase(now)
+            cache = C.PROPS_CACHE.get(phase, 1.0)
+            if not force and state.last_props > 0 and now - state.last_props < cache: return None
         if not force and not self._api_ok(now): return None
-        try:
-            props = self.client.torrents_properties(torrent_hash=h)
-            state.last_props = now
-            return props
+        try: return self.client.torrents_properties(torrent_hash=h)
         except: return None
     
+    def _refresh_props(self, torrents: Dict[str, Any], now: float) -> Dict[str, dict]:
+        candidates = []
+        for h, t in torrents.items():
+            if not self._should_manage(t): continue
+            state = self.states.get(h)
+            if state is None:
+                candidates.append((h, C.PHASE_WARMUP, 9999, C.PROPS_STALE_CAP)); continue
+            if self._interval_trusted(state, now): continue
+            phase = state.get_phase(now)
+            cache = C.PROPS_CACHE.get(phase, 1.0)
+            age = now - state.last_props if state.last_props > 0 else cache * C.PROPS_STALE_CAP
+            if age < cache: continue
+            candidates.append((h, phase, state.get_tl(now), min(C.PROPS_STALE_CAP, age / cache)))
+        result = {}
+        for h, phase in self.props_queue.order(candidates):
+            if not self._api_ok(now):
+                self.props_queue.mark(phase, False); continue
+            self.props_queue.mark(phase, True)
+            with self.perf.stage('props'): props = self._get_props(h, None, now, force=True)
+            if props is not None:
+                result[h] = props
+                if self.recorder: self.recorder.props(now, h, props)
+        return result
+    
+    def _interval_trusted(self, state: TorrentState, now: float) -> bool:
+        # 间隔模型可信时 tl 不依赖 props，只在每次汇报后的采样窗口内取一次用于校验
+        last = state.last_announce_time
+        if not state.interval_confident or not last or last <= 0: return False
+        return state.interval_sampled >= last or not (C.ANNOUNCE_MODEL_VERIFY_DELAY <= now - last <= C.ANNOUNCE_MODEL_SAMPLE_WINDOW)
+    
+    def _learn_interval(self, state: TorrentState, now: float, ra: float):
+        # 汇报后不久读到的 reannounce + 距上次汇报的时间 = 一个完整间隔，每个周期只取一个样本
+        last = state.last_announce_time
+        if not last or last <= 0 or state.interval_sampled == last or now - last > C.ANNOUNCE_MODEL_SAMPLE_WINDOW: return
+        state.interval_sampled = last
+        band = state.age_band(now)
+        if not self.announce_model.observe(state.tracker, band, ra + now - last) and state.interval_confident:
+            logger.warning(f"[{state.name[:16]}] ⏱ 汇报间隔与模型不符: {ra + now - last:.0f}s vs {state.announce_interval:.0f}s，恢复 props 轮询")
+        state.announce_interval, state.interval_confident = self.announce_model.predict(state.tracker, band)
+    
     def _should_manage(self, torrent: Any) -> bool:
         tracker = getattr(torrent, 'tracker', '') or ''
         if self.config.exclude_tracker_keyword and self.config.exclude_tracker_keyword in tracker: return False
@@ -199,13 +399,13 @@ class Controller:
             except: pass
         threading.Thread(target=check, daemon=True).start()
 
-    def _do_reannounce(self, state: TorrentState, reason: str):
+    def _do_reannounce(self, state: TorrentState, reason: str, now: float):
         try:
             self.client.torrents_reannounce(torrent_hashes=state.hash)
-            state.last_reannounce = wall_time()
+            state.last_reannounce = now
             state.reannounced_this_cycle = True
             state.waiting_reannounce = False
-            state.last_announce_time = wall_time()
+            state.last_announce_time = now
             logger.warning(f"[{state.name[:16]}] 🔄 强制汇报: {reason}")
             self.notifier.reannounce_notify(state.name, reason, state.tid)
         except: pass
@@ -215,14 +415,19 @@ class Controller:
             return int(self.notifier.temp_target_kib * 1024 * self.config.safety_margin)
         return self.config.target_bytes
 
-    def _calc_upload_limit(self, state: TorrentState, torrent: Any, now: float, tl: float) -> Tuple[int, str]:
+    def _physical_cap(self, current: float) -> int:
+        cap = self.config.max_physical_bytes
+        shared = self.budget.torrent_cap(current)
+        if shared > 0: cap = min(cap, shared) if cap > 0 else shared
+        return cap
+    
+    def _calc_upload_limit(self, state: TorrentState, torrent: Any, now: float, tl: float, defer: bool = False) -> Tuple[Optional[int], Any]:
         if self.notifier.paused: return -1, "已暂停"
         target = self._get_effective_target()
-        max_phy = self.config.max_physical_bytes
         current = getattr(torrent, 'upspeed', 0) or 0
         total_uploaded = getattr(torrent, 'uploaded', 0) or 0
         state.limit_controller.record_speed(now, current)
-        real_speed = state.get_real_avg_speed(total_uploaded)
+        real_speed = state.get_real_avg_speed(total_uploaded, now)
         
         if real_speed > C.SPEED_LIMIT * 1.05:
             logger.warning(f"[{state.name[:15]}] ⚠️ 超速 {fmt_speed(real_speed)}!")
@@ -234,11 +439,26 @@ class Controller:
         elapsed = state.elapsed(now)
         uploaded = state.uploaded_in_cycle(total_uploaded)
         phase = state.get_phase(now)
-        precision_adj = _precision_tracker.get_adjustment(phase)
+        precision_adj = self.precision.get_adjustment(state.tracker, phase, PrecisionModel.size_bucket(state.total_size))
+        # 新限速要在 _lead 秒后才生效，期间仍按当前速度上传：把控制点前推到生效时刻
+        ctl = tl
+        if self._lead > 0 and tl > 2 * self._lead:
+            uploaded += int(current * self._lead); elapsed += self._lead; ctl = tl - self._lead
         
-        limit, reason, debug = state.limit_controller.calculate(target, uploaded, tl, elapsed, phase, now, precision_adj)
+        # 批量模式下返回待算行，由 _run_batch 统一计算
+        if defer: return None, (state.hash, target, uploaded, ctl, elapsed, phase, precision_adj)
+        limit, reason, debug = state.limit_controller.calculate(target, uploaded, ctl, elapsed, phase, now, precision_adj)
         state.last_debug = debug
-        
+        return self._cap_upload_limit(state, current, uploaded, target, now, tl, limit, reason)
+    
+    def _control_lead(self) -> float:
+        """采样到新限速在 qB 生效的预计延迟：读取半程 + 本地处理 + 写入半程"""
+        lead = self.read_rtt.srtt / 2 + self.proc_lag.srtt + self.actuator.rtt.srtt / 2
+        return min(lead, C.LATENCY_MAX_LEAD) if lead >= C.LATENCY_MIN_LEAD else 0.0
+    
+    def _cap_upload_limit(self, state: TorrentState, current: float, uploaded: int, target: int, now: float, tl: float, limit: int, reason: str) -> Tuple[int, str]:
+        # 启用整机分配时物理上限改由 _allocate_uplink 统一分摊
+        max_phy = self._physical_cap(current) if self._alloc_pending is None else 0
         if max_phy > 0:
             if limit == -1: limit = int(max_phy)
             elif limit > max_phy: limit = int(max_phy)
@@ -275,10 +495,10 @@ class Controller:
         if total_size <= 0: return
         if state.waiting_reannounce:
             should, reason = ReannounceOptimizer.check_waiting_reannounce(state, total_uploaded, now)
-            if should: self._do_reannounce(state, reason)
+            if should: self._do_reannounce(state, reason, now)
             return
         should, reason = ReannounceOptimizer.should_reannounce(state, total_uploaded, total_done, total_size, up_speed, dl_speed, now)
-        if should: self._do_reannounce(state, reason)
+        if should: self._do_reannounce(state, reason, now)
 
     def _report(self, state: TorrentState, torrent: Any, now: float):
         if state.report_sent: return
@@ -289,9 +509,9 @@ class Controller:
         uploaded = state.uploaded_in_cycle(total_uploaded)
         speed = safe_div(uploaded, duration, 0)
         ratio = safe_div(speed, target, 0)
-        real_speed = state.get_real_avg_speed(total_uploaded)
+        real_speed = state.get_real_avg_speed(total_uploaded, now)
         phase = state.get_phase(now)
-        _precision_tracker.record(ratio, phase, now)
+        self.precision.record(state.tracker, phase, PrecisionModel.size_bucket(state.total_size), ratio)
         self.stats.record(ratio, uploaded)
         total_size = getattr(torrent, 'total_size', 0) or state.total_size
         total_done = getattr(torrent, 'completed', 0) or getattr(torrent, 'downloaded', 0) or 0
@@ -299,19 +519,27 @@ class Controller:
         g = "🎯" if abs(ratio - 1) <= C.PRECISION_PERFECT else ("✅" if abs(ratio - 1) <= C.PRECISION_GOOD else ("👍" if ratio >= 0.95 else "⚠️"))
         extra = (" 📥" if state.dl_limited_this_cycle else "") + (" 🔄" if state.reannounced_this_cycle else "")
         logger.info(f"[{torrent.name[:16]}] {g} 汇报 ↑{fmt_speed(speed)}({ratio*100:.1f}%){extra}")
-        self.notifier.cycle_report({'name': torrent.name, 'hash': state.hash, 'speed': speed, 'real_speed': real_speed, 'target': target, 'ratio': ratio, 'uploaded': uploaded, 'duration': duration, 'idx': state.cycle_index, 'tid': state.tid, 'total_size': total_size, 'total_uploaded_life': total_uploaded, 'total_downloaded_life': total_done, 'progress_pct': progress_pct})
+        info = {'name': torrent.name, 'hash': state.hash, 'speed': speed, 'real_speed': real_speed, 'target': target, 'ratio': ratio, 'uploaded': uploaded, 'duration': duration, 'idx': state.cycle_index, 'tid': state.tid, 'total_size': total_size, 'total_uploaded_life': total_uploaded, 'total_downloaded_life': total_done, 'progress_pct': progress_pct, 'phase': phase, 'dl_limited': state.dl_limited_this_cycle, 'reannounced': state.reannounced_this_cycle, 'tracker': state.tracker, 'time': now}
+        self.notifier.cycle_report(info)
+        self.writer.submit('save_cycle_history', [info])
+        for listener in self.cycle_listeners:
+            try: listener(info)
+            except: pass
 
-    def _process(self, torrent: Any, now: float, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]]) -> float:
+    def _process(self, torrent: Any, now: float, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]], props: Optional[dict] = None) -> float:
         h = torrent.hash
         if not self._should_manage(torrent): return 9999
         total_uploaded = getattr(torrent, 'uploaded', 0) or 0
         total_downloaded = getattr(torrent, 'completed', 0) or getattr(torrent, 'downloaded', 0) or 0
         if h not in self.states:
-            state = TorrentState(h)
-            db_data = self.db.load_torrent_state(h)
+            self._removed.discard(h)  # 删除后又被重新添加 (如 RSS)，按新种子对待
+            state = TorrentState(h, self.batch.attach(h) if self.batch is not None else None)
+            db_data = self._preload.pop(h, None)
             if db_data:
                 state.load_from_db(db_data)
-                logger.info(f"📦 恢复: {torrent.name[:20]} (# {state.cycle_index})")
+                # 本次运行中停放过的种子带着 saved_key，未变化时不必重写
+                if 'saved_key' in db_data: state.saved_key = db_data['saved_key']
+                else: logger.info(f"📦 恢复: {torrent.name[:20]} (# {state.cycle_index})")
             state.time_added = getattr(torrent, 'added_on', 0) or 0
             state.initial_uploaded = total_uploaded
             state.total_size = getattr(torrent, 'total_size', 0) or 0
@@ -323,18 +551,19 @@ class Controller:
         state = self.states[h]
         state.name = torrent.name
         if state.total_size <= 0: state.total_size = getattr(torrent, 'total_size', 0) or 0
+        if not state.tracker: state.tracker = tracker_host(getattr(torrent, 'tracker', '') or '')
         state.speed_tracker.record(now, total_uploaded, total_downloaded, getattr(torrent, 'upspeed', 0) or 0, getattr(torrent, 'dlspeed', 0) or 0)
         self._maybe_check_peer_list(state, now)
         
-        props = self._get_props(h, state, now)
-        tl = state.get_tl(now)
+        state.announce_interval, state.interval_confident = self.announce_model.predict(state.tracker, state.age_band(now))
         if props:
+            state.last_props = now
             ra = props.get('reannounce', 0) or 0
             if 0 < ra < C.MAX_REANNOUNCE:
                 state.cached_tl = ra; state.cache_ts = now
-                if not state.last_announce_time: tl = ra
+                self._learn_interval(state, now, ra)
+        tl = state.get_tl(now)
         
-        current_up_limit = getattr(torrent, 'up_limit', -1) or -1
         is_jump = state.cycle_start > 0 and tl > state.prev_tl + 30
         
         if not state.monitor_notified:
@@ -347,14 +576,64 @@ class Controller:
         
         if state.cycle_start == 0 or is_jump:
             if is_jump: self._report(state, torrent, now)
-            state.new_cycle(now, total_uploaded, tl, is_jump)
+            state.new_cycle(now, total_uploaded, tl, is_jump, self._get_effective_target())
             logger.info(f"[{torrent.name[:16]}] 🔄 周期 #{state.cycle_index} {'✅同步' if state.cycle_synced else '⏳预热'} tid={state.tid or ''}")
         
         state.prev_tl = tl
-        up_limit, up_reason = self._calc_upload_limit(state, torrent, now, tl)
-        dl_limit, dl_reason = self._calc_download_limit(state, torrent, now)
+        with self.perf.stage('calc_limit'):
+            up_limit, up_reason = self._calc_upload_limit(state, torrent, now, tl, self._batch_pending is not None)
+            dl_limit, dl_reason = self._calc_download_limit(state, torrent, now)
         self._check_reannounce(state, torrent, now)
-        
+        if up_limit is None:
+            self._batch_pending.append((up_reason, state, torrent, tl, dl_limit, dl_reason))
+            return tl
+        self._submit_limits(state, torrent, now, tl, up_limit, up_reason, dl_limit, dl_reason, up_actions, dl_actions)
+        return tl
+
+    def _run_batch(self, now: float, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]]):
+        pending, self._batch_pending = self._batch_pending, None
+        if not pending: return
+        with self.perf.stage('calc_limit'):
+            limits, reasons, debugs = self.batch.calculate([p[0] for p in pending], now)
+        for (row, state, torrent, tl, dl_limit, dl_reason), limit, reason, debug in zip(pending, limits, reasons, debugs):
+            try:
+                state.last_debug = debug
+                current = getattr(torrent, 'upspeed', 0) or 0
+                limit, reason = self._cap_upload_limit(state, current, row[2], row[1], now, tl, limit, reason)
+                self._submit_limits(state, torrent, now, tl, limit, reason, dl_limit, dl_reason, up_actions, dl_actions)
+            except Exception as e: logger.debug(f"批量限速失败 {state.hash[:8]}: {e}")
+
+    def _submit_limits(self, state: TorrentState, torrent: Any, now: float, tl: float, up_limit: int, up_reason: str,
+                       dl_limit: int, dl_reason: str, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]]):
+        if self._alloc_pending is None:
+            return self._apply_limits(state, torrent, now, tl, up_limit, up_reason, dl_limit, dl_reason, up_actions, dl_actions)
+        state.up_demand = up_limit; state.up_demand_reason = up_reason
+        self._alloc_pending.append((state, torrent, tl, dl_limit, dl_reason))
+
+    def _allocate_uplink(self, now: float, capacity: float, active: Dict[str, Any], up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]]):
+        """所有种子的需求齐备后按距汇报远近分摊整机上传，到期种子直接下发，其余仅在配额明显变化时重发"""
+        pending, self._alloc_pending = self._alloc_pending, None
+        if pending is None: return
+        due = {p[0].hash: p for p in pending}
+        states = [s for h, s in self.states.items() if h in active]
+        with self.perf.stage('allocate'):
+            grants = UplinkAllocator.allocate(capacity, [(s.up_demand, getattr(active[s.hash], 'upspeed', 0) or 0, s.prev_tl) for s in states])
+        for state, grant in zip(states, grants):
+            limit, reason = state.up_demand, state.up_demand_reason
+            if limit == -1 or limit > grant: limit, reason = grant, f"{reason}/分配"
+            p = due.get(state.hash)
+            if p:
+                self._apply_limits(state, p[1], now, p[2], limit, reason, p[3], p[4], up_actions, dl_actions)
+                continue
+            last = state.last_up_limit
+            if limit == last or (last > 0 and limit > 0 and abs(limit - last) <= last * C.ALLOC_REPUSH_RATIO): continue
+            self._apply_limits(state, active[state.hash], now, state.prev_tl, limit, reason, state.last_dl_limit, "", up_actions, dl_actions)
+
+    def _apply_limits(self, state: TorrentState, torrent: Any, now: float, tl: float, up_limit: int, up_reason: str,
+                      dl_limit: int, dl_reason: str, up_actions: Dict[int, List[str]], dl_actions: Dict[int, List[str]]):
+        h = state.hash
+        total_uploaded = getattr(torrent, 'uploaded', 0) or 0
+        current_up_limit = getattr(torrent, 'up_limit', -1) or -1
         if now - state.last_log > C.LOG_INTERVAL or state.last_log_limit != up_limit:
             uploaded = state.uploaded_in_cycle(total_uploaded)
             total = state.estimate_total(now, tl)
@@ -380,36 +659,101 @@ class Controller:
             dl_actions.setdefault(dl_limit * 1024 if dl_limit > 0 else -1, []).append(h)
             self.modified_dl.add(h)
             state.last_dl_limit = dl_limit
-        return tl
 
     def run(self):
         cfg = self.config
         target = self._get_effective_target()
-        logger.info(f"🚀 qBit Smart Limit v{C.VERSION} | 目标: {fmt_speed(target)} | DL限速: {cfg.enable_dl_limit} | TG: {self.notifier.enabled}")
+        if self.parent is None:
+            logger.info(f"🚀 qBit Smart Limit v{C.VERSION} | 目标: {fmt_speed(target)} | DL限速: {cfg.enable_dl_limit} | TG: {self.notifier.enabled} | 实例: {len(self.children) + 1}")
+            for child in self.children:
+                threading.Thread(target=child._run_host, daemon=True, name=f"Host-{child.name}").start()
         self._connect()
-        self.notifier.startup(cfg, self.qb_version, self.u2_enabled)
-        while self.running:
-            start = wall_time()
-            min_tl = 3600
-            try:
-                self._check_config(start)
-                torrents = self.client.torrents_info(status_filter='active')
-                up_actions = {}; dl_actions = {}; now = wall_time()
-                for t in torrents:
-                    if getattr(t, 'state', '') in self.ACTIVE:
-                        try: min_tl = min(min_tl, self._process(t, now, up_actions, dl_actions))
-                        except: pass
-                for limit, hashes in up_actions.items(): self.client.torrents_set_upload_limit(limit, hashes)
-                for limit, hashes in dl_actions.items(): self.client.torrents_set_download_limit(limit, hashes)
-                active = {t.hash for t in torrents if getattr(t, 'state', '') in self.ACTIVE}
-                for h in list(self.states):
-                    if h not in active: del self.states[h]
-            except APIConnectionError:
-                logger.warning("⚠️ 连接断开，重连中...")
-                time.sleep(5)
-                try: self._connect()
-                except: pass
-            except Exception as e: logger.error(f"❌ 异常: {e}")
-            elapsed = wall_time() - start
-            sleep = 0.15 if min_tl <= 5 else (0.25 if min_tl <= 15 else (0.4 if min_tl <= 30 else (0.8 if min_tl <= 90 else 1.5)))
-            time.sleep(max(0.1, sleep - elapsed))
+        if self.parent is None: self.notifier.startup(cfg, self.qb_version, self.u2_enabled)
+        self._loop()
+    
+    def _run_host(self):
+        try: self.run()
+        except BaseException as e: logger.error(f"❌ 实例 {self.name} 已退出: {e}")
+    
+    def _tick(self, torrents: List[Any], now: float) -> float:
+        """处理一次 tick 中到期的种子并下发限速，返回本 tick 最紧的评估间隔"""
+        budget = C.SCHED_LADDER[-1][1]
+        up_actions = {}; dl_actions = {}
+        active = {t.hash: t for t in torrents if getattr(t, 'state', '') in self.ACTIVE}
+        if self.recorder: self.recorder.torrents(now, active.values())
+        own = sum(getattr(t, 'upspeed', 0) or 0 for t in active.values())
+        self.budget.report(self.name, own)
+        # 整机上限扣除未受管种子的占用后，由受管种子分摊
+        capacity = 0 if self.notifier.paused else self._physical_cap(own)
+        if capacity > 0: capacity = max(C.MIN_LIMIT, capacity - sum(getattr(t, 'upspeed', 0) or 0 for h, t in active.items() if h not in self.states))
+        self._alloc_pending = [] if capacity > 0 else None
+        self._lead = self._control_lead()
+        due = {h: active[h] for h in self.scheduler.pop_due(now, active) if h in active}
+        props = self._refresh_props(due, now)
+        if self.batch is not None: self._batch_pending = []
+        for h, t in due.items():
+            state = self.states.get(h)
+            if state and state.next_eval > 0 and state.get_phase(now) == C.PHASE_FINISH:
+                self.perf.observe('finish_lag', max(0, now - state.next_eval))
+            t0 = time.perf_counter()
+            try: tl = self._process(t, now, up_actions, dl_actions, props.get(h))
+            except: tl = 9999
+            self.perf.observe('process', time.perf_counter() - t0)
+            state = self.states.get(h)
+            interval = eval_interval(tl, state.get_phase(now)) if state else C.SCHED_MAX_INTERVAL
+            if state: state.next_eval = now + interval
+            self.scheduler.schedule(h, now + interval)
+            budget = min(budget, interval)
+        if self.batch is not None: self._run_batch(now, up_actions, dl_actions)
+        self._allocate_uplink(now, capacity, active, up_actions, dl_actions)
+        self._apply_at = wall_time()
+        with self.perf.stage('write_limit'): self.actuator.apply(up_actions, dl_actions)
+        dropped = [h for h in self.states if h not in active]
+        # 移出前把未落盘的变化送进写队列；状态停放在内存索引里，再次活跃时直接恢复 (含 Kalman/PID)，不读库
+        rows = []
+        for h in dropped:
+            state = self.states.pop(h)
+            if h in self._removed: self._removed.discard(h); continue
+            parked = state_dict(state); key = state.persist_key()
+            parked['key'] = parked['saved_key'] = key
+            self._preload[h] = parked  # 先停放再入队，写入失败的回调才能找到它
+            if key != state.saved_key: rows.append(parked['row'])
+        if rows: self.writer.submit('save_state_rows', rows)
+        for h in dropped:
+            self.scheduler.discard(h)
+            self.actuator.forget(h)
+            if self.batch is not None: self.batch.release(h)
+        return budget
+    
+    def _loop(self):
+        if self.config.record_path:
+            path = self.config.record_path if self.parent is None else f"{self.config.record_path}.{self.name}"
+            self.recorder = TickRecorder(path)
+        while self.running: get_clock().sleep(self._step())
+    
+    def _step(self) -> float:
+        """主循环的一次迭代，返回距下次唤醒的秒数；时间均取自全局时钟，仿真时可整体加速"""
+        start = wall_time()
+        budget = C.SCHED_LADDER[-1][1]
+        try:
+            with self.perf.stage('config'): self._check_config(start)
+            t0 = wall_time()
+            with self.perf.stage('torrents_info'): torrents = self._fetch_torrents(start)
+            t1 = wall_time(); self.read_rtt.observe(t1 - t0)
+            # qB 返回的快照大致对应请求往返的中点
+            budget = self._tick(torrents, (t0 + t1) / 2)
+            if self._apply_at > t1: self.proc_lag.observe(self._apply_at - t1)
+        except APIConnectionError:
+            logger.warning("⚠️ 连接断开，重连中...")
+            get_clock().sleep(5)
+            try: self._connect()
+            except: pass
+        except Exception as e: logger.error(f"❌ 异常: {e}")
+        now = wall_time()
+        self.perf.end_tick(now - start, budget)
+        if self.parent is None and self.perf_dump and now - self._last_perf_dump > C.PERF_DUMP_INTERVAL:
+            self._last_perf_dump = now
+            try: dump_perf(self.perf_dump, {c.name: c.perf for c in [self] + self.children})
+            except Exception as e: logger.debug(f"性能数据写入失败: {e}")
+        wake = self.scheduler.next_deadline(now + C.SCHED_LADDER[-1][1])
+        return max(C.SCHED_MIN_SLEEP, min(C.SCHED_LADDER[-1][1], wake - now))
@@ -1,111 +1,267 @@
+import json
+import queue
 import sqlite3
 import threading
-from typing import Optional, List
+from datetime import datetime
+from itertools import islice
+from typing import Optional, List, Tuple, Iterable, Dict, Callable
 from .consts import C
-from .utils import wall_time
+from .utils import wall_time, logger, fmt_size
+
+_SAVE_STATE = '''INSERT OR REPLACE INTO torrent_states 
+    (hash, name, tid, promotion, publish_time, cycle_index, cycle_start, 
+     cycle_start_uploaded, cycle_synced, cycle_interval, total_uploaded_start,
+     session_start_time, last_announce_time, updated_at, controller_state, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def _state_row(state, now: float) -> tuple:
+    return (state.hash, state.name, state.tid, state.promotion,
+            state.publish_time, state.cycle_index, state.cycle_start,
+            state.cycle_start_uploaded, 1 if state.cycle_synced else 0,
+            state.cycle_interval, state.total_uploaded_start,
+            state.session_start_time, state.last_announce_time, now,
+            json.dumps(state.limit_controller.export_state()), now)
+
+def state_rows(states: Iterable, now: Optional[float] = None) -> List[tuple]:
+    now = wall_time() if now is None else now
+    return [_state_row(st, now) for st in states]
+
+_ROLLUPS = ('cycle_rollup_hourly', 'cycle_rollup_daily')
+
+_ROLLUP_ADD = '''INSERT INTO {table}
+    (bucket, tracker, cycles, ratio_sum, ratio_min, ratio_max, precise, uploaded, duration, reannounced, dl_limited)
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket, tracker) DO UPDATE SET
+        cycles = cycles + 1, ratio_sum = ratio_sum + excluded.ratio_sum,
+        ratio_min = MIN(ratio_min, excluded.ratio_min), ratio_max = MAX(ratio_max, excluded.ratio_max),
+        precise = precise + excluded.precise, uploaded = uploaded + excluded.uploaded,
+        duration = duration + excluded.duration, reannounced = reannounced + excluded.reannounced,
+        dl_limited = dl_limited + excluded.dl_limited'''
+
+def _buckets(ts: float) -> Tuple[float, float]:
+    """(整点, 本地零点)"""
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    return ts - ts % 3600, day
+
+def state_dict(state) -> dict:
+    """与 load_torrent_state 相同格式的内存快照，row 为可直接交给 save_state_rows 的同一份行"""
+    row = _state_row(state, wall_time())
+    d = _state_dict(row); d['row'] = row
+    return d
+
+def _loads(text: Optional[str]) -> Optional[dict]:
+    if not text: return None
+    try: return json.loads(text)
+    except ValueError: return None
+
+def _state_dict(row: tuple) -> dict:
+    return {
+        'hash': row[0], 'name': row[1], 'tid': row[2], 'promotion': row[3],
+        'publish_time': row[4], 'cycle_index': row[5], 'cycle_start': row[6],
+        'cycle_start_uploaded': row[7], 'cycle_synced': bool(row[8]),
+        'cycle_interval': row[9], 'total_uploaded_start': row[10],
+        'session_start_time': row[11], 'last_announce_time': row[12],
+        'controller_state': _loads(row[14])
+    }
+
+# 迁移需可重入：中途退出后重跑不应出错 (DDL 不在隐式事务里)
+def _migrate_v1(c: sqlite3.Connection):
+    # 引入版本表之前的全部表结构，对旧库重放无副作用
+    # 种子状态表
+    c.execute('''CREATE TABLE IF NOT EXISTS torrent_states (
+        hash TEXT PRIMARY KEY,
+        name TEXT,
+        tid INTEGER,
+        promotion TEXT,
+        publish_time REAL,
+        cycle_index INTEGER,
+        cycle_start REAL,
+        cycle_start_uploaded INTEGER,
+        cycle_synced INTEGER,
+        cycle_interval REAL,
+        total_uploaded_start INTEGER,
+        session_start_time REAL,
+        last_announce_time REAL,
+        updated_at REAL,
+        controller_state TEXT
+    )''')
+    # 旧库补列：Kalman/PID 热启动状态
+    cols = {r[1] for r in c.execute('PRAGMA table_info(torrent_states)')}
+    if 'controller_state' not in cols:
+        c.execute('ALTER TABLE torrent_states ADD COLUMN controller_state TEXT')
+    
+    # 统计表
+    c.execute('''CREATE TABLE IF NOT EXISTS stats (
+        id INTEGER PRIMARY KEY,
+        total_cycles INTEGER,
+        success_cycles INTEGER,
+        precision_cycles INTEGER,
+        total_uploaded INTEGER,
+        start_time REAL,
+        updated_at REAL
+    )''')
+    
+    # 精度模型表
+    c.execute('''CREATE TABLE IF NOT EXISTS precision_model (
+        tracker TEXT,
+        phase TEXT,
+        size_bucket INTEGER,
+        samples INTEGER,
+        mean REAL,
+        adj REAL,
+        updated_at REAL,
+        PRIMARY KEY (tracker, phase, size_bucket)
+    )''')
+    
+    # 汇报间隔模型表
+    c.execute('''CREATE TABLE IF NOT EXISTS announce_model (
+        tracker TEXT,
+        age_band INTEGER,
+        samples INTEGER,
+        mean REAL,
+        dev REAL,
+        misses INTEGER,
+        updated_at REAL,
+        PRIMARY KEY (tracker, age_band)
+    )''')
+    
+    # 配置运行时状态表
+    c.execute('''CREATE TABLE IF NOT EXISTS runtime_config (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at REAL
+    )''')
+    
+    # 周期明细表：超过 HISTORY_RAW_DAYS 的明细只保留在汇总表里
+    c.execute('''CREATE TABLE IF NOT EXISTS cycle_history (
+        id INTEGER PRIMARY KEY,
+        ts REAL,
+        hash TEXT,
+        tracker TEXT,
+        cycle_index INTEGER,
+        phase TEXT,
+        ratio REAL,
+        uploaded INTEGER,
+        duration REAL,
+        reannounced INTEGER,
+        dl_limited INTEGER
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cycle_history_ts ON cycle_history (ts)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cycle_history_hash ON cycle_history (hash, ts)')
+    
+    # 按小时/天的汇总表，写明细时增量累加
+    for table in _ROLLUPS:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            bucket REAL,
+            tracker TEXT,
+            cycles INTEGER,
+            ratio_sum REAL,
+            ratio_min REAL,
+            ratio_max REAL,
+            precise INTEGER,
+            uploaded INTEGER,
+            duration REAL,
+            reannounced INTEGER,
+            dl_limited INTEGER,
+            PRIMARY KEY (bucket, tracker)
+        )''')
+
+def _migrate_v2(c: sqlite3.Connection):
+    # 最近一次在活跃种子里出现的时间，清理长期不见的种子状态用
+    cols = {r[1] for r in c.execute('PRAGMA table_info(torrent_states)')}
+    if 'last_seen' not in cols: c.execute('ALTER TABLE torrent_states ADD COLUMN last_seen REAL')
+    c.execute('UPDATE torrent_states SET last_seen = updated_at WHERE last_seen IS NULL')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_torrent_states_last_seen ON torrent_states (last_seen)')
+
+def _migrate_v3(c: sqlite3.Connection):
+    # auto_vacuum 只能在 VACUUM 重建后生效，之后由维护任务做增量回收
+    c.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    c.execute('VACUUM')
+
+_MIGRATIONS = [
+    (1, "初始表结构", _migrate_v1),
+    (2, "torrent_states.last_seen", _migrate_v2),
+    (3, "增量 vacuum", _migrate_v3),
+]
 
 class Database:
+    """单个长连接 (WAL)，各线程经 _lock 串行访问；语句文本固定，由 sqlite3 的语句缓存复用预编译结果"""
     def __init__(self, db_path: str = C.DB_PATH):
         self.db_path = db_path
         self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=64)
+        # WAL 下 NORMAL 只在检查点 fsync，写事务不再每次落盘
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.last_report: Optional[dict] = None  # 最近一次 maintain 的结果
         self._init_db()
     
+    def close(self):
+        with self._lock:
+            try: self._conn.close()
+            except sqlite3.Error: pass
+    
     def _init_db(self):
+        """按 schema_version 依次执行未应用的迁移，每个迁移一个事务"""
         with self._lock:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            
-            # 种子状态表
-            c.execute('''CREATE TABLE IF NOT EXISTS torrent_states (
-                hash TEXT PRIMARY KEY,
-                name TEXT,
-                tid INTEGER,
-                promotion TEXT,
-                publish_time REAL,
-                cycle_index INTEGER,
-                cycle_start REAL,
-                cycle_start_uploaded INTEGER,
-                cycle_synced INTEGER,
-                cycle_interval REAL,
-                total_uploaded_start INTEGER,
-                session_start_time REAL,
-                last_announce_time REAL,
-                updated_at REAL
-            )''')
-            
-            # 统计表
-            c.execute('''CREATE TABLE IF NOT EXISTS stats (
-                id INTEGER PRIMARY KEY,
-                total_cycles INTEGER,
-                success_cycles INTEGER,
-                precision_cycles INTEGER,
-                total_uploaded INTEGER,
-                start_time REAL,
-                updated_at REAL
-            )''')
-            
-            # 配置运行时状态表
-            c.execute('''CREATE TABLE IF NOT EXISTS runtime_config (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at REAL
-            )''')
-            
-            conn.commit()
-            conn.close()
+            self._conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at REAL)')
+            self._conn.commit()
+            current = self._conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+            if current > _MIGRATIONS[-1][0]:
+                logger.warning(f"⚠️ 数据库版本 v{current} 高于程序支持的 v{_MIGRATIONS[-1][0]}")
+            for version, name, fn in _MIGRATIONS:
+                if version <= current: continue
+                with self._conn as conn:
+                    fn(conn)
+                    conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)', (version, name, wall_time()))
+                if current > 0: logger.info(f"🗄️ 数据库迁移 v{version}: {name}")
     
     def save_torrent_state(self, state):
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute('''INSERT OR REPLACE INTO torrent_states 
-                (hash, name, tid, promotion, publish_time, cycle_index, cycle_start, 
-                 cycle_start_uploaded, cycle_synced, cycle_interval, total_uploaded_start,
-                 session_start_time, last_announce_time, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                (state.hash, state.name, state.tid, state.promotion,
-                 state.publish_time, state.cycle_index, state.cycle_start,
-                 state.cycle_start_uploaded, 1 if state.cycle_synced else 0,
-                 state.cycle_interval, state.total_uploaded_start,
-                 state.session_start_time, state.last_announce_time, wall_time()))
-            conn.commit()
-            conn.close()
+        self.save_torrent_states((state,))
+    
+    def save_torrent_states(self, states: Iterable, batch: int = C.DB_BATCH_SIZE):
+        now = wall_time()
+        it = iter(states)
+        while True:
+            rows = [_state_row(st, now) for st in islice(it, batch)]
+            if not rows: return
+            self.save_state_rows(rows, batch)
+    
+    def save_state_rows(self, rows: Iterable[tuple], batch: int = C.DB_BATCH_SIZE):
+        """每批一个事务 executemany；批与批之间释放锁，避免长时间阻塞其它线程"""
+        it = iter(rows)
+        while True:
+            chunk = list(islice(it, batch))
+            if not chunk: return
+            with self._lock, self._conn as conn: conn.executemany(_SAVE_STATE, chunk)
     
     def load_torrent_state(self, torrent_hash: str) -> Optional[dict]:
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('SELECT * FROM torrent_states WHERE hash = ?', (torrent_hash,))
             row = c.fetchone()
-            conn.close()
-            
-            if not row: return None
-            return {
-                'hash': row[0], 'name': row[1], 'tid': row[2], 'promotion': row[3],
-                'publish_time': row[4], 'cycle_index': row[5], 'cycle_start': row[6],
-                'cycle_start_uploaded': row[7], 'cycle_synced': bool(row[8]),
-                'cycle_interval': row[9], 'total_uploaded_start': row[10],
-                'session_start_time': row[11], 'last_announce_time': row[12]
-            }
+            return _state_dict(row) if row else None
     
-    def save_stats(self, stats):
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
+    def load_all_torrent_states(self) -> Dict[str, dict]:
+        """启动时一次读出全部种子状态，按 hash 建索引"""
+        with self._lock, self._conn as conn:
+            rows = conn.execute('SELECT * FROM torrent_states').fetchall()
+        return {row[0]: _state_dict(row) for row in rows}
+    
+    def save_stats(self, stats: dict):
+        """stats 为 Stats.snapshot()，键与 load_stats 一致"""
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('''INSERT OR REPLACE INTO stats 
                 (id, total_cycles, success_cycles, precision_cycles, total_uploaded, start_time, updated_at)
                 VALUES (1, ?, ?, ?, ?, ?, ?)''',
-                (stats.total, stats.success, stats.precision, stats.uploaded, stats.start, wall_time()))
-            conn.commit()
-            conn.close()
+                (stats['total'], stats['success'], stats['precision'], stats['uploaded'], stats['start'], wall_time()))
     
     def load_stats(self) -> Optional[dict]:
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('SELECT * FROM stats WHERE id = 1')
             row = c.fetchone()
-            conn.close()
             
             if not row: return None
             return {
@@ -113,29 +269,173 @@ class Database:
                 'uploaded': row[4], 'start': row[5]
             }
     
-    def save_runtime_config(self, key: str, value: str):
+    def save_precision_model(self, rows: List[Tuple]):
+        if not rows: return
+        now = wall_time()
+        with self._lock, self._conn as conn:
+            c = conn.cursor()
+            c.executemany('''INSERT OR REPLACE INTO precision_model
+                (tracker, phase, size_bucket, samples, mean, adj, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                [tuple(r) + (now,) for r in rows])
+    
+    def load_precision_model(self) -> List[Tuple]:
+        with self._lock, self._conn as conn:
+            c = conn.cursor()
+            c.execute('SELECT tracker, phase, size_bucket, samples, mean, adj FROM precision_model')
+            rows = c.fetchall()
+            return rows
+    
+    def save_announce_model(self, rows: List[Tuple]):
+        if not rows: return
+        now = wall_time()
+        with self._lock, self._conn as conn:
+            c = conn.cursor()
+            c.executemany('''INSERT OR REPLACE INTO announce_model
+                (tracker, age_band, samples, mean, dev, misses, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                [tuple(r) + (now,) for r in rows])
+    
+    def load_announce_model(self) -> List[Tuple]:
+        with self._lock, self._conn as conn:
+            c = conn.cursor()
+            c.execute('SELECT tracker, age_band, samples, mean, dev, misses FROM announce_model')
+            rows = c.fetchall()
+            return rows
+    
+    def delete_torrent_state(self, torrent_hash: str):
+        with self._lock, self._conn as conn:
+            conn.execute('DELETE FROM torrent_states WHERE hash = ?', (torrent_hash,))
+    
+    def touch_torrent_states(self, hashes: List[str], now: float):
+        with self._lock, self._conn as conn:
+            conn.executemany('UPDATE torrent_states SET last_seen = ? WHERE hash = ?', [(now, h) for h in hashes])
+    
+    def maintain(self, seen: List[str], now: float, prune: bool = True) -> dict:
+        """定期维护：按 qB 仍报告的种子刷新 last_seen，清理久未出现的种子状态与过期历史，增量回收空闲页并截断 WAL；
+        seen 不完整时 prune=False，只刷新不删"""
+        self.touch_torrent_states(seen, now)
+        states = 0
+        if prune:
+            with self._lock, self._conn as conn:
+                states = conn.execute('DELETE FROM torrent_states WHERE last_seen < ?', (now - C.STATE_PRUNE_DAYS * 86400,)).rowcount
+        raw, hourly = self.prune_cycle_history(now)
         with self._lock:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._conn
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            pages, page_size = conn.execute('PRAGMA page_count').fetchone()[0], conn.execute('PRAGMA page_size').fetchone()[0]
+            rows = conn.execute('SELECT (SELECT COUNT(*) FROM torrent_states), (SELECT COUNT(*) FROM cycle_history)').fetchone()
+        self.last_report = {'time': now, 'size': pages * page_size, 'freed': free * page_size, 'states': rows[0],
+                            'history': rows[1], 'pruned_states': states, 'pruned_history': raw, 'pruned_hourly': hourly}
+        logger.info(f"🗄️ 数据库维护: {fmt_size(pages * page_size)} (回收 {fmt_size(free * page_size)})，"
+                    f"种子状态 {rows[0]} (清理 {states})，周期明细 {rows[1]} (清理 {raw})")
+        return self.last_report
+    
+    def save_cycle_history(self, rows: List[dict]):
+        """rows 为周期结果 (cycle_listeners 的 info)；明细与两张汇总表在同一事务里写入"""
+        if not rows: return
+        with self._lock, self._conn as conn:
+            for r in rows:
+                ts = r['time']; ratio = r['ratio']; tracker = r.get('tracker') or ''
+                precise = 1 if abs(ratio - 1) <= C.PRECISION_PERFECT else 0  # 与 Stats.precision 同一阈值
+                flags = (1 if r.get('reannounced') else 0, 1 if r.get('dl_limited') else 0)
+                conn.execute('''INSERT INTO cycle_history
+                    (ts, hash, tracker, cycle_index, phase, ratio, uploaded, duration, reannounced, dl_limited)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (ts, r['hash'], tracker, r.get('idx', 0), r.get('phase', ''), ratio, r['uploaded'], r['duration']) + flags)
+                for table, bucket in zip(_ROLLUPS, _buckets(ts)):
+                    conn.execute(_ROLLUP_ADD.format(table=table),
+                                 (bucket, tracker, ratio, ratio, ratio, precise, r['uploaded'], r['duration']) + flags)
+    
+    def prune_cycle_history(self, now: float) -> Tuple[int, int]:
+        """明细超过 HISTORY_RAW_DAYS、小时汇总超过 HISTORY_HOURLY_DAYS 的删除，天汇总长期保留"""
+        with self._lock, self._conn as conn:
+            raw = conn.execute('DELETE FROM cycle_history WHERE ts < ?', (now - C.HISTORY_RAW_DAYS * 86400,)).rowcount
+            hourly = conn.execute('DELETE FROM cycle_rollup_hourly WHERE bucket < ?', (now - C.HISTORY_HOURLY_DAYS * 86400,)).rowcount
+        return raw, hourly
+    
+    def cycle_trend(self, period: str, since: float, tracker: Optional[str] = None) -> List[Tuple]:
+        """按桶汇总的趋势: (bucket, cycles, 平均比例, 最低, 最高, precise, uploaded, reannounced, dl_limited)；period 为 hourly/daily"""
+        table = 'cycle_rollup_hourly' if period == 'hourly' else 'cycle_rollup_daily'
+        where = 'bucket >= ?' + (' AND tracker = ?' if tracker else '')
+        args = (since, tracker) if tracker else (since,)
+        with self._lock, self._conn as conn:
+            return conn.execute(f'''SELECT bucket, SUM(cycles), SUM(ratio_sum) / SUM(cycles), MIN(ratio_min), MAX(ratio_max),
+                SUM(precise), SUM(uploaded), SUM(reannounced), SUM(dl_limited)
+                FROM {table} WHERE {where} GROUP BY bucket ORDER BY bucket''', args).fetchall()
+    
+    def load_cycle_history(self, torrent_hash: str, limit: int = 50) -> List[Tuple]:
+        """单个种子最近的周期明细 (ts, cycle_index, phase, ratio, uploaded, duration, reannounced, dl_limited)，新的在前"""
+        with self._lock, self._conn as conn:
+            return conn.execute('''SELECT ts, cycle_index, phase, ratio, uploaded, duration, reannounced, dl_limited
+                FROM cycle_history WHERE hash = ? ORDER BY ts DESC LIMIT ?''', (torrent_hash, limit)).fetchall()
+    
+    def save_runtime_config(self, key: str, value: str):
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('INSERT OR REPLACE INTO runtime_config (key, value, updated_at) VALUES (?, ?, ?)',
                       (key, value, wall_time()))
-            conn.commit()
-            conn.close()
     
     def get_runtime_config(self, key: str) -> Optional[str]:
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('SELECT value FROM runtime_config WHERE key = ?', (key,))
             row = c.fetchone()
-            conn.close()
             return row[0] if row else None
             
     def get_all_torrent_hashes(self) -> List[str]:
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._lock, self._conn as conn:
             c = conn.cursor()
             c.execute('SELECT hash FROM torrent_states')
             rows = c.fetchall()
-            conn.close()
             return [r[0] for r in rows]
+
+
+class DbWriter:
+    """后台写线程：调用方只把已快照的行放进队列，本线程一次取空队列、同一种子只写最新一行"""
+    def __init__(self, db: Database, on_failed: Optional[Callable[[str, tuple], None]] = None):
+        self.db = db
+        self.on_failed = on_failed  # (kind, args)：写入失败时通知调用方，以便下一轮重新入队
+        self.failures = 0
+        self._queue: queue.Queue = queue.Queue()
+        self.writes = 0
+        self.rows = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="DB-Writer")
+        self._thread.start()
+    
+    def submit(self, kind: str, *args):
+        """kind 为 Database 的方法名，save_state_rows 的行按 hash 合并"""
+        self._queue.put((kind, args))
+    
+    def close(self, timeout: float = 10):
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            try:
+                while True: items.append(self._queue.get_nowait())
+            except queue.Empty: pass
+            states: dict = {}; others = []
+            for item in items:
+                if item is None: continue
+                kind, args = item
+                if kind == 'save_state_rows':
+                    for row in args[0]: states[row[0]] = row
+                else: others.append(item)
+            # 各任务独立提交，一个失败不影响同批的其它任务
+            jobs = ([('save_state_rows', (list(states.values()),))] if states else []) + others
+            for kind, args in jobs:
+                try:
+                    getattr(self.db, kind)(*args)
+                    if kind == 'save_state_rows': self.rows += len(args[0])
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"保存数据库失败 ({kind}): {e}")
+                    if self.on_failed:
+                        try: self.on_failed(kind, args)
+                        except Exception: pass
+            self.writes += 1
+            for _ in items: self._queue.task_done()
+            if any(item is None for item in items): return
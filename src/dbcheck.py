@@ -0,0 +1,136 @@
+"""数据库自检: python -m src.dbcheck [--keep]  (旧库迁移、写线程合并与失败重排、维护清理)"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from typing import List
+from .consts import C
+from .model import TorrentState
+from .database import Database, DbWriter, state_rows, _MIGRATIONS
+
+# 引入迁移之前 (v0) 的库结构
+LEGACY_SCHEMA = ('''CREATE TABLE torrent_states (
+    hash TEXT PRIMARY KEY, name TEXT, tid INTEGER, promotion TEXT, publish_time REAL, cycle_index INTEGER,
+    cycle_start REAL, cycle_start_uploaded INTEGER, cycle_synced INTEGER, cycle_interval REAL,
+    total_uploaded_start INTEGER, session_start_time REAL, last_announce_time REAL, updated_at REAL)''',
+    '''CREATE TABLE stats (id INTEGER PRIMARY KEY, total_cycles INTEGER, success_cycles INTEGER,
+    precision_cycles INTEGER, total_uploaded INTEGER, start_time REAL, updated_at REAL)''',
+    '''CREATE TABLE runtime_config (key TEXT PRIMARY KEY, value TEXT, updated_at REAL)''')
+WAIT = 5.0
+
+class Checker:
+    def __init__(self):
+        self.failures: List[str] = []
+        self.passed = 0
+
+    def check(self, ok: bool, what: str):
+        if ok: self.passed += 1
+        else: self.failures.append(what)
+        print(f"{'✅' if ok else '❌'} {what}")
+
+def _wait(cond, timeout: float = WAIT) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond(): return True
+        time.sleep(0.01)
+    return cond()
+
+def legacy_db(path: str, now: float):
+    conn = sqlite3.connect(path)
+    for sql in LEGACY_SCHEMA: conn.execute(sql)
+    conn.execute("INSERT INTO torrent_states VALUES ('old', 'old', 7, '免费', 0, 12, 0, 0, 1, 1800, 0, 0, 0, 1000)")
+    conn.execute("INSERT INTO torrent_states VALUES ('kept', 'kept', 8, '免费', 0, 3, 0, 0, 0, 1800, 0, 0, 0, ?)", (now,))
+    conn.execute("INSERT INTO stats VALUES (1, 10, 9, 4, 123456, 1000, 1000)")
+    conn.commit(); conn.close()
+
+def check_migration(ck: Checker, path: str, now: float):
+    legacy_db(path, now)
+    db = Database(path)
+    latest = _MIGRATIONS[-1][0]
+    versions = [r[0] for r in db._conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    ck.check(versions == list(range(1, latest + 1)), f"旧库迁移到 v{latest}: {versions}")
+    cols = {r[1] for r in db._conn.execute('PRAGMA table_info(torrent_states)')}
+    ck.check({'controller_state', 'last_seen'} <= cols, "torrent_states 补列 controller_state/last_seen")
+    row = db.load_torrent_state('old')
+    ck.check(bool(row) and row['cycle_index'] == 12 and row['tid'] == 7 and row['controller_state'] is None, "旧行可读")
+    ck.check(db._conn.execute("SELECT last_seen FROM torrent_states WHERE hash = 'old'").fetchone()[0] == 1000, "last_seen 由 updated_at 回填")
+    ck.check((db.load_stats() or {}).get('total') == 10, "旧统计可读")
+    ck.check(db._conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2, "auto_vacuum=INCREMENTAL")
+    ck.check(db._conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal', "journal_mode=WAL")
+    db.close()
+    db = Database(path)
+    ck.check(db._conn.execute('SELECT COUNT(*) FROM schema_version').fetchone()[0] == latest, "重复打开不重跑迁移")
+    db.close()
+
+def check_writer(ck: Checker, path: str):
+    db = Database(path)
+    failed = []
+    writer = DbWriter(db, lambda kind, args: failed.append((kind, args)))
+    st = TorrentState('w' * 40); st.name = 'w'
+    # 第一批：同一种子两行只写最新一行
+    st.cycle_index = 1; first = state_rows([st])
+    st.cycle_index = 2; second = state_rows([st])
+    with db._lock:
+        writer.submit('save_runtime_config', 'dbcheck', 'hold')
+        _wait(lambda: writer._queue.empty())  # 写线程已取走并卡在锁上，后面的任务进同一批
+        writer.submit('save_state_rows', first); writer.submit('save_state_rows', second)
+    ck.check(_wait(lambda: (db.load_torrent_state(st.hash) or {}).get('cycle_index') == 2), "同一种子合并为最新一行")
+    ck.check(writer.rows == 1, f"合并后只写 1 行 (实际 {writer.rows})")
+    # 第二批：状态行失败，同批的其它任务照常提交并回调失败的行
+    save = db.save_state_rows
+    def broken(rows, *a): raise sqlite3.OperationalError("disk I/O error (dbcheck)")
+    db.save_state_rows = broken
+    with db._lock:
+        writer.submit('save_runtime_config', 'dbcheck', 'hold')
+        _wait(lambda: writer._queue.empty())
+        st.cycle_index = 3; writer.submit('save_state_rows', state_rows([st]))
+        writer.submit('save_stats', {'total': 5, 'success': 5, 'precision': 1, 'uploaded': 1, 'start': 1.0})
+        writer.submit('delete_torrent_state', 'kept')
+    ck.check(_wait(lambda: bool(failed)), "失败任务触发 on_failed")
+    ck.check(bool(failed) and failed[0][0] == 'save_state_rows' and failed[0][1][0][0][0] == st.hash, "回调带回失败的种子行")
+    ck.check(_wait(lambda: (db.load_stats() or {}).get('total') == 5), "同批 save_stats 未被跳过")
+    ck.check(_wait(lambda: db.load_torrent_state('kept') is None), "同批 delete_torrent_state 未被跳过")
+    ck.check(db.load_torrent_state(st.hash)['cycle_index'] == 2, "失败的行未落盘")
+    # 重新入队后写入成功
+    db.save_state_rows = save
+    writer.submit('save_state_rows', failed[0][1][0])
+    ck.check(_wait(lambda: db.load_torrent_state(st.hash)['cycle_index'] == 3), "重新入队后写入")
+    writer.close(); db.close()
+
+def check_maintain(ck: Checker, path: str, now: float):
+    db = Database(path)
+    states = [TorrentState(h) for h in ('seen', 'gone')]
+    db.save_torrent_states(states)
+    db._conn.execute('UPDATE torrent_states SET last_seen = 0'); db._conn.commit()
+    db.save_cycle_history([{'time': now - (C.HISTORY_RAW_DAYS + 1) * 86400, 'hash': 'seen', 'ratio': 1.0, 'uploaded': 1, 'duration': 1800}])
+    r = db.maintain(['seen'], now, prune=False)
+    ck.check(r['pruned_states'] == 0 and db.load_torrent_state('gone') is not None, "列表不完整时不清理种子状态")
+    ck.check(r['pruned_history'] == 1 and bool(db.cycle_trend('daily', 0)), "过期明细删除、天汇总保留")
+    r = db.maintain(['seen'], now)
+    hashes = set(db.get_all_torrent_hashes())
+    ck.check('seen' in hashes and 'gone' not in hashes, f"只清理 qB 不再报告的种子: 清理 {r['pruned_states']} 行")
+    ck.check(r['size'] > 0 and r['size'] == os.path.getsize(path), f"大小报告 {r['size']}B")
+    db.close()
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.dbcheck")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    args = parser.parse_args(argv)
+    tmp = tempfile.mkdtemp(prefix="qsl-dbcheck-")
+    ck = Checker(); now = time.time()
+    try:
+        path = os.path.join(tmp, 'legacy.db')
+        check_migration(ck, path, now)
+        check_writer(ck, path)
+        check_maintain(ck, path, now)
+    finally:
+        if args.keep: print(f"📁 {tmp}")
+        else: shutil.rmtree(tmp, ignore_errors=True)
+    print(f"{ck.passed} 通过, {len(ck.failures)} 失败")
+    return 1 if ck.failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
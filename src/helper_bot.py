@@ -172,7 +172,7 @@ class Notifier:
             '/start': self._cmd_help, '/help': self._cmd_help, '/status': self._cmd_status,
             '/pause': self._cmd_pause, '/resume': self._cmd_resume, '/limit': self._cmd_limit,
             '/log': self._cmd_log, '/cookie': self._cmd_cookie, '/config': self._cmd_config,
-            '/stats': self._cmd_stats,
+            '/stats': self._cmd_stats, '/perf': self._cmd_perf,
         }
         handler = handlers.get(cmd, self._cmd_unknown)
         try: handler(args)
@@ -187,6 +187,7 @@ class Notifier:
 📊 <b>状态查询</b>
 ├ /status - 查看所有种子状态
 ├ /stats - 查看统计信息
+├ /perf [reset] - 查看控制循环耗时
 └ /log [n] - 查看最近n条日志
 
 ⚙️ <b>控制命令</b>
@@ -203,7 +204,7 @@ class Notifier:
     
     def _cmd_status(self, args: str):
         if not self.controller: return
-        states = self.controller.states
+        states = self.controller.all_states()
         if not states:
             self.send_immediate("📭 当前没有正在监控的种子")
             return
@@ -295,8 +296,30 @@ class Notifier:
 ⏱️ 运行时长: <code>{fmt_duration(uptime)}</code>
 📊 总周期: <code>{stats.total}</code>
 📤 总上传: <code>{fmt_size(stats.uploaded)}</code>"""
+        report = self.controller.db.last_report
+        if report: msg += f"\n🗄️ 数据库: <code>{fmt_size(report['size'])}</code> ({report['states']} 个种子状态)"
+        # 近 7 天按天汇总 (周期数 / 平均比例 / 精准率 / 上传量)
+        try: trend = self.controller.db.cycle_trend('daily', wall_time() - 7 * 86400)
+        except Exception: trend = []
+        if trend:
+            msg += "\n━━━━━━━━━━━━━━━━━━━━━\n📅 <b>近 7 天</b>"
+            for bucket, cycles, avg, _, _, precise, uploaded, _, _ in trend:
+                msg += f"\n<code>{datetime.fromtimestamp(bucket).strftime('%m-%d')} {cycles:>4}周期 {avg * 100:6.2f}% 精准{safe_div(precise, cycles, 0) * 100:3.0f}% {fmt_size(uploaded)}</code>"
         self.send_immediate(msg)
 
+    def _cmd_perf(self, args: str):
+        if not self.controller: return
+        hosts = [self.controller] + list(getattr(self.controller, 'children', []))
+        if args.strip().lower() == 'reset':
+            for c in hosts: c.perf.reset()
+            self.send_immediate("✅ 性能统计已重置")
+            return
+        lines = ["⏱️ <b>控制循环耗时</b>", "━━━━━━━━━━━━━━━━━━━━━"]
+        for c in hosts:
+            if len(hosts) > 1: lines.append(f"🖥 <b>{escape_html(c.name)}</b>")
+            lines.extend(f"<code>{escape_html(l)}</code>" for l in c.perf.format_lines())
+        self.send_immediate("\n".join(lines))
+
     def _cmd_unknown(self, args):
         self.send_immediate("❓ 未知命令")
 
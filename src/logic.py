@@ -1,47 +1,38 @@
-from typing import Tuple
+from typing import Tuple, List
 from .consts import C
 
 class DownloadLimiter:
+    """下载完成会立即触发汇报：用下载速度 Kalman 预测完成时刻，限速使完成不早于本周期上传均值回落到 SPEED_LIMIT 的时刻"""
     @staticmethod
     def calc_dl_limit(state, total_uploaded: int, total_done: int, 
                       total_size: int, eta: int, up_speed: float, dl_speed: float, 
                       now: float) -> Tuple[int, str]:
+        state.dl_kalman.update(dl_speed, now)
         this_up = state.this_up(total_uploaded)
         this_time = state.this_time(now)
         if this_time < 2: return -1, ""
         
-        avg_speed = this_up / this_time
-        if avg_speed <= C.SPEED_LIMIT:
-            if state.last_dl_limit > 0: return -1, "均值恢复"
-            return -1, ""
-        
+        last = state.last_dl_limit
         remaining = total_size - total_done
-        if remaining <= 0: return -1, ""
+        excess = this_up - C.SPEED_LIMIT * this_time
+        if remaining <= 0 or excess <= 0:
+            return (-1, "均值恢复") if last > 0 else (-1, "")
         
-        min_time = C.DL_LIMIT_MIN_TIME * (2 if state.last_up_limit > 0 else 1)
+        # 完成前上传仍按估计速度继续，超出部分以 (SPEED_LIMIT - 上传) 的速率消化，至少按 DL_DRAIN_MIN 计
+        up = state.limit_controller.kalman.speed or up_speed
+        drain = max(C.SPEED_LIMIT - up, C.SPEED_LIMIT * C.DL_DRAIN_MIN)
+        safe = excess / drain + C.DL_PREDICT_MARGIN
+        limit = max(C.DL_LIMIT_MIN, int(remaining / safe / 1024))
         
-        if state.last_dl_limit <= 0:
-            if 0 < eta <= min_time:
-                denominator = this_up / C.SPEED_LIMIT - this_time + C.DL_LIMIT_BUFFER
-                if denominator <= 0: return C.DL_LIMIT_MIN, "超速严重"
-                dl_limit = remaining / denominator / 1024
-                return max(C.DL_LIMIT_MIN, int(dl_limit)), f"均值超限"
-        else:
-            if avg_speed >= C.SPEED_LIMIT:
-                if dl_speed / 1024 < 2 * state.last_dl_limit:
-                    denominator = this_up / C.SPEED_LIMIT - this_time + C.DL_LIMIT_ADJUST_BUFFER
-                    if denominator <= 0: return C.DL_LIMIT_MIN, "超速严重"
-                    new_limit = remaining / denominator / 1024
-                    new_limit = min(new_limit, 512000)
-                    if new_limit > 1.5 * state.last_dl_limit:
-                        new_limit = 1.5 * state.last_dl_limit
-                    elif new_limit < state.last_dl_limit:
-                        new_limit = new_limit / 1.5
-                    return max(C.DL_LIMIT_MIN, int(new_limit)), "调整中"
-                return state.last_dl_limit, "保持"
-            else:
-                return -1, "均值恢复"
-        return -1, ""
+        if last > 0:
+            if limit >= C.DL_LIMIT_MAX: return -1, "预测安全"
+            if abs(limit - last) <= last * C.DL_LIMIT_HYSTERESIS: return last, "保持"
+            return limit, "预测调整"
+        # 未限速时按预测完成时间判断；qB 的 eta 更早时以 eta 为准
+        finish = state.dl_kalman.time_to_finish(remaining)
+        if eta > 0: finish = min(finish, eta)
+        if finish >= safe: return -1, ""
+        return min(limit, C.DL_LIMIT_MAX), "预测超限"
 
 class ReannounceOptimizer:
     @staticmethod
@@ -55,13 +46,13 @@ class ReannounceOptimizer:
         this_time = state.this_time(now)
         if this_time < 30: return False, ""
         
-        avg_up, avg_dl = state.speed_tracker.get_avg_speeds(C.REANNOUNCE_SPEED_SAMPLES)
+        avg_up, avg_dl = state.speed_tracker.get_avg_speeds(now, C.REANNOUNCE_SPEED_SAMPLES)
         if avg_up <= C.SPEED_LIMIT or avg_dl <= 0: return False, ""
         
         remaining = total_size - total_done
         if remaining <= 0: return False, ""
         
-        announce_interval = state.get_announce_interval()
+        announce_interval = state.get_announce_interval(now)
         complete_time = remaining / avg_dl + now
         perfect_time = complete_time - announce_interval * C.SPEED_LIMIT / avg_up
         
@@ -94,3 +85,24 @@ class ReannounceOptimizer:
         if avg_speed < C.SPEED_LIMIT:
             return True, "均值恢复"
         return False, ""
+
+class UplinkAllocator:
+    @staticmethod
+    def allocate(capacity: float, demands: List[Tuple[float, float, float]]) -> List[int]:
+        """整机上传在种子间的分配；demands 为 (需求 B/s 且 -1 表示不限, 当前速度, tl)，返回各自的配额"""
+        n = len(demands)
+        if n == 0: return []
+        floor = min(C.MIN_LIMIT, capacity / n)
+        grant = [floor] * n
+        left = capacity - floor * n
+        want = [capacity if d < 0 else max(floor, d) for d, _, _ in demands]
+        order = sorted(range(n), key=lambda i: demands[i][2])
+        # 第一轮按距汇报由近到远、只给当前速度放大后用得上的量；第二轮按同一顺序把剩余补到需求
+        for i in order:
+            if left <= 0: break
+            usable = min(want[i], max(demands[i][1] * C.ALLOC_GROWTH, C.ALLOC_MIN_GRANT))
+            extra = min(left, max(0, usable - grant[i])); grant[i] += extra; left -= extra
+        for i in order:
+            if left <= 0: break
+            extra = min(left, want[i] - grant[i]); grant[i] += extra; left -= extra
+        return [max(1024, int(g)) for g in grant]
@@ -2,8 +2,8 @@ import threading
 from typing import Optional, Dict, Any
 from dataclasses import dataclass, field
 from .consts import C
-from .utils import wall_time, estimate_announce_interval, get_phase, safe_div
-from .algorithms import PrecisionLimitController, SpeedTracker
+from .utils import wall_time, estimate_announce_interval, announce_age_band, get_phase, safe_div
+from .algorithms import PrecisionLimitController, SpeedTracker, DownloadKalman
 
 @dataclass
 class Stats:
@@ -12,12 +12,22 @@ class Stats:
     success: int = 0
     precision: int = 0
     uploaded: int = 0
+    dirty: bool = field(default=True, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
     
     def record(self, ratio: float, uploaded: int):
-        self.total += 1
-        self.uploaded += uploaded
-        if ratio >= 0.95: self.success += 1
-        if abs(ratio - 1) <= C.PRECISION_PERFECT: self.precision += 1
+        with self._lock:
+            self.total += 1; self.dirty = True
+            self.uploaded += uploaded
+            if ratio >= 0.95: self.success += 1
+            if abs(ratio - 1) <= C.PRECISION_PERFECT: self.precision += 1
+    
+    def snapshot(self) -> dict:
+        """供写线程落库的快照，同时清除 dirty"""
+        with self._lock:
+            self.dirty = False
+            return {'total': self.total, 'success': self.success, 'precision': self.precision,
+                    'uploaded': self.uploaded, 'start': self.start}
     
     def load_from_db(self, data: dict):
         if not data: return
@@ -26,14 +36,43 @@ class Stats:
         self.precision = data.get('precision', 0)
         self.uploaded = data.get('uploaded', 0)
         self.start = data.get('start', wall_time())
+        self.dirty = False
+
+class BandwidthBudget:
+    """多个 qB 实例共享的整机上传带宽预算"""
+    def __init__(self, limit_bytes: int = 0):
+        self.limit = limit_bytes
+        self._usage: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def report(self, host: str, speed: float):
+        with self._lock: self._usage[host] = speed
+    
+    def total(self) -> float:
+        with self._lock: return sum(self._usage.values())
+    
+    def torrent_cap(self, current: float) -> int:
+        # 预算减去除本种子外所有实例的当前上传
+        if self.limit <= 0: return 0
+        return max(C.MIN_LIMIT, int(self.limit - max(0, self.total() - current)))
 
 class TorrentState:
-    def __init__(self, h: str):
+    # 固定槽位，不再为每个种子分配 __dict__；字段均由主循环读写 (TID 线程只做单字段赋值)
+    __slots__ = ('hash', 'name', 'tracker', 'tid', 'tid_searched', 'tid_search_time', 'tid_not_found', 'promotion', 'monitor_notified',
+                 'cycle_start', 'cycle_start_uploaded', 'cycle_synced', 'cycle_interval', 'cycle_index', 'jump_count', 'last_jump',
+                 'time_added', 'publish_time', 'last_announce_time', 'announce_interval', 'interval_confident',
+                 'interval_sampled', 'initial_uploaded', 'total_size', 'total_uploaded_start', 'up_demand', 'up_demand_reason',
+                 'session_start_time', 'cached_tl', 'cache_ts', 'prev_tl', 'last_up_limit', 'last_up_reason', 'last_dl_limit',
+                 'dl_limited_this_cycle', 'last_reannounce', 'reannounced_this_cycle', 'waiting_reannounce', 'last_log',
+                 'last_log_limit', 'last_props', 'next_eval', 'report_sent', 'last_peer_list_check', 'peer_list_uploaded',
+                 'limit_controller', 'speed_tracker', 'dl_kalman', 'saved_key', 'last_debug')
+    
+    def __init__(self, h: str, limit_controller: Any = None):
         self.hash = h
         self.name = ""
-        self._lock = threading.RLock()
+        self.tracker = ""
         
-        self._tid: Optional[int] = None
+        self.tid: Optional[int] = None
         self.tid_searched = False
         self.tid_search_time = 0.0
         self.tid_not_found = False
@@ -49,8 +88,11 @@ class TorrentState:
         self.last_jump = 0.0
         
         self.time_added = 0.0
-        self._publish_time: Optional[float] = None
-        self._last_announce_time: Optional[float] = None
+        self.publish_time: Optional[float] = None
+        self.last_announce_time: Optional[float] = None
+        self.announce_interval = 0.0  # 间隔模型的预测，0 表示按年龄估算
+        self.interval_confident = False
+        self.interval_sampled = 0.0
         
         self.initial_uploaded = 0
         self.total_size = 0
@@ -61,6 +103,8 @@ class TorrentState:
         self.cache_ts = 0.0
         self.prev_tl = 0.0
         
+        self.up_demand = -1  # 整机分配前的限速需求
+        self.up_demand_reason = ""
         self.last_up_limit = -1
         self.last_up_reason = ""
         self.last_dl_limit = -1
@@ -73,54 +117,45 @@ class TorrentState:
         self.last_log = 0.0
         self.last_log_limit = -1
         self.last_props = 0.0
+        self.next_eval = 0.0
         self.report_sent = False
         
         self.last_peer_list_check = 0.0
         self.peer_list_uploaded: Optional[int] = None
         
-        self.limit_controller = PrecisionLimitController()
+        self.limit_controller = limit_controller if limit_controller is not None else PrecisionLimitController()
         self.speed_tracker = SpeedTracker()
+        self.dl_kalman = DownloadKalman()
+        self.saved_key: Optional[tuple] = None  # 上次入写队列时的 persist_key
         self.last_debug: Dict[str, Any] = {}
     
-    @property
-    def tid(self) -> Optional[int]:
-        with self._lock: return self._tid
-    @tid.setter
-    def tid(self, value: Optional[int]):
-        with self._lock: self._tid = value
-    
-    @property
-    def publish_time(self) -> Optional[float]:
-        with self._lock: return self._publish_time
-    @publish_time.setter
-    def publish_time(self, value: Optional[float]):
-        with self._lock: self._publish_time = value
-    
-    @property
-    def last_announce_time(self) -> Optional[float]:
-        with self._lock: return self._last_announce_time
-    @last_announce_time.setter
-    def last_announce_time(self, value: Optional[float]):
-        with self._lock: self._last_announce_time = value
-    
     def get_tl(self, now: float) -> float:
-        with self._lock:
-            if self._last_announce_time and self._last_announce_time > 0:
-                interval = self.get_announce_interval()
-                next_announce = self._last_announce_time + interval
-                return max(0, next_announce - now)
-            if self.cache_ts <= 0: return 9999
-            return max(0, self.cached_tl - (now - self.cache_ts))
+        # 以较新的来源确定下次汇报时刻：汇报之后取到的 props 优先，否则按上次汇报 + 间隔推算
+        last = self.last_announce_time
+        if self.cache_ts > 0 and not (last and last > self.cache_ts): nxt = self.cache_ts + self.cached_tl
+        elif last and last > 0: nxt = last + self.get_announce_interval(now)
+        else: return 9999
+        if now < nxt: return nxt - now
+        if not self.interval_confident: return 0
+        # 间隔可信时向后外推已过去的汇报，tl 的跳变即视为新周期
+        interval = self.get_announce_interval(now)
+        return interval - (now - nxt) % interval
     
     def get_phase(self, now: float) -> str:
         return get_phase(self.get_tl(now), self.cycle_synced)
     
-    def get_announce_interval(self) -> int:
-        with self._lock:
-            if self._publish_time and self._publish_time > 0:
-                return estimate_announce_interval(self._publish_time)
-        if self.time_added > 0:
-            return estimate_announce_interval(self.time_added)
+    def age_ref(self) -> float:
+        publish = self.publish_time
+        return publish if publish and publish > 0 else self.time_added
+    
+    def age_band(self, now: float) -> int:
+        ref = self.age_ref()
+        return announce_age_band(ref, now) if ref > 0 else 0
+    
+    def get_announce_interval(self, now: Optional[float] = None) -> int:
+        if self.announce_interval > 0: return int(self.announce_interval)
+        ref = self.age_ref()
+        if ref > 0: return estimate_announce_interval(ref, now)
         return C.ANNOUNCE_INTERVAL_NEW
     
     def elapsed(self, now: float) -> float:
@@ -141,14 +176,14 @@ class TorrentState:
         if self.cycle_synced and self.cycle_interval > 0: return max(1, self.cycle_interval)
         return max(1, e)
     
-    def get_real_avg_speed(self, current_uploaded: int) -> float:
+    def get_real_avg_speed(self, current_uploaded: int, now: float) -> float:
         if self.session_start_time <= 0: return 0
-        elapsed = wall_time() - self.session_start_time
+        elapsed = now - self.session_start_time
         if elapsed < 10: return 0
         uploaded = current_uploaded - self.total_uploaded_start
         return safe_div(uploaded, elapsed, 0)
     
-    def new_cycle(self, now: float, uploaded: int, tl: float, is_jump: bool):
+    def new_cycle(self, now: float, uploaded: int, tl: float, is_jump: bool, target: float = 0):
         if is_jump:
             self.jump_count += 1
             if self.jump_count >= 2 and self.last_jump > 0:
@@ -157,11 +192,11 @@ class TorrentState:
             self.last_jump = now
             self.cycle_index += 1
             self.cycle_start_uploaded = uploaded
-            with self._lock: self._last_announce_time = now
-        elif self.time_added > 0 and (now - self.time_added) < self.get_announce_interval():
+            self.last_announce_time = now
+        elif self.time_added > 0 and (now - self.time_added) < self.get_announce_interval(now):
             self.cycle_start_uploaded = 0
         else:
-            interval = self.get_announce_interval()
+            interval = self.get_announce_interval(now)
             elapsed_in_cycle = interval - tl if 0 < tl < interval else 0
             if elapsed_in_cycle > 60:
                 avg_speed = self.limit_controller.kalman.speed
@@ -176,9 +211,15 @@ class TorrentState:
         self.reannounced_this_cycle = False
         self.waiting_reannounce = False
         self.last_dl_limit = -1
-        self.limit_controller.reset()
+        self.limit_controller.warm_start(target)
         self.speed_tracker.clear()
     
+    def persist_key(self) -> tuple:
+        # 落库的标量字段，与 saved_key 不同即为脏；控制器状态随行一起写，新周期必然变脏，最多滞后一个周期
+        return (self.name, self.tid, self.promotion, self.publish_time, self.cycle_index, self.cycle_start,
+                self.cycle_start_uploaded, self.cycle_synced, self.cycle_interval, self.total_uploaded_start,
+                self.session_start_time, self.last_announce_time)
+    
     def load_from_db(self, data: dict):
         if not data: return
         self.name = data.get('name', '')
@@ -194,3 +235,4 @@ class TorrentState:
         self.session_start_time = data.get('session_start_time', 0)
         self.last_announce_time = data.get('last_announce_time')
         if self.tid: self.tid_searched = True
+        if data.get('controller_state'): self.limit_controller.import_state(data['controller_state'])
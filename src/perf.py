@@ -0,0 +1,108 @@
+import json
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+from .consts import C
+
+class Histogram:
+    """固定桶 (毫秒) 延迟直方图"""
+    def __init__(self, bounds_ms: List[float] = C.PERF_BUCKETS_MS):
+        self.bounds = list(bounds_ms)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        i = 0
+        while i < len(self.bounds) and ms > self.bounds[i]: i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max: self.max = ms
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0: return 0.0
+        rank = q * self.count; seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(self.max, lo + (hi - lo) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'mean_ms': round(self.total / self.count, 3) if self.count else 0,
+                'p50_ms': round(self.percentile(0.50), 3), 'p95_ms': round(self.percentile(0.95), 3),
+                'p99_ms': round(self.percentile(0.99), 3), 'max_ms': round(self.max, 3),
+                'buckets': dict(zip([str(b) for b in self.bounds] + ['inf'], self.counts))}
+
+class RttEstimator:
+    """TCP 式平滑往返时延：srtt 与 rttvar 的 EWMA (秒)"""
+    __slots__ = ('srtt', 'rttvar', 'samples')
+
+    def __init__(self):
+        self.srtt = 0.0; self.rttvar = 0.0; self.samples = 0
+
+    def observe(self, seconds: float):
+        if self.samples == 0: self.srtt = seconds; self.rttvar = seconds / 2
+        else:
+            self.rttvar += (abs(seconds - self.srtt) - self.rttvar) * 0.25
+            self.srtt += (seconds - self.srtt) * 0.125
+        self.samples += 1
+
+class PerfMonitor:
+    STAGES = ('tick', 'config', 'torrents_info', 'process', 'props', 'calc_limit', 'allocate', 'write_limit', 'finish_lag')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hists: Dict[str, Histogram] = {s: Histogram() for s in self.STAGES}
+        self.ticks = 0
+        self.overruns = 0
+        self.since = time.time()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            h = self.hists.get(stage)
+            if h is None: h = self.hists[stage] = Histogram()
+            h.observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - t0)
+
+    def end_tick(self, seconds: float, budget: float):
+        self.observe('tick', seconds)
+        with self._lock:
+            self.ticks += 1
+            if seconds > budget: self.overruns += 1
+
+    def reset(self):
+        with self._lock:
+            self.hists = {s: Histogram() for s in self.STAGES}
+            self.ticks = 0; self.overruns = 0; self.since = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'since': self.since, 'ticks': self.ticks, 'overruns': self.overruns,
+                    'stages': {k: h.to_dict() for k, h in self.hists.items()}}
+
+    def format_lines(self) -> List[str]:
+        snap = self.snapshot()
+        lines = [f"tick={snap['ticks']} 超时={snap['overruns']}"]
+        for name, d in snap['stages'].items():
+            if not d['count']: continue
+            lines.append(f"{name:<12} p50={d['p50_ms']:.1f} p95={d['p95_ms']:.1f} p99={d['p99_ms']:.1f} max={d['max_ms']:.1f}ms n={d['count']}")
+        return lines
+
+def dump_perf(path: str, monitors: Dict[str, PerfMonitor]):
+    data = {'ts': time.time(), 'hosts': {name: m.snapshot() for name, m in monitors.items()}}
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f: json.dump(data, f)
+    os.replace(tmp, path)
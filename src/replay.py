@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import zlib
+import struct
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Any, Iterator, Tuple, Optional, Iterable
+from .consts import C
+from .utils import SimClock, set_clock
+
+MAGIC = b'QSLR1\n'
+_HEADER = struct.Struct('<cdI')
+KIND_TORRENTS = b'T'
+KIND_PROPS = b'P'
+
+# _process 用到的 torrents_info 字段
+TORRENT_FIELDS = ('name', 'state', 'upspeed', 'dlspeed', 'uploaded', 'completed', 'downloaded',
+                  'total_size', 'eta', 'up_limit', 'tracker', 'added_on')
+PROPS_FIELDS = ('reannounce',)
+
+class TickRecorder:
+    """将 _process 看到的 torrents_info / torrents_properties 追加写入紧凑的二进制日志 (按字段做增量)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, 'ab')
+        if new: self._f.write(MAGIC)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._last_flush = time.time()
+
+    def _write(self, kind: bytes, ts: float, payload: Any):
+        data = zlib.compress(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            self._f.write(_HEADER.pack(kind, ts, len(data)))
+            self._f.write(data)
+            if time.time() - self._last_flush > 5:
+                self._f.flush(); self._last_flush = time.time()
+
+    def torrents(self, ts: float, torrents: Iterable[Any]):
+        diff: Dict[str, Dict[str, Any]] = {}
+        seen = set()
+        for t in torrents:
+            h = t.hash; seen.add(h)
+            cur = {k: getattr(t, k, None) for k in TORRENT_FIELDS}
+            prev = self._last.get(h)
+            changed = cur if prev is None else {k: v for k, v in cur.items() if prev.get(k) != v}
+            if changed or prev is None: diff[h] = changed
+            self._last[h] = cur
+        removed = [h for h in self._last if h not in seen]
+        for h in removed: del self._last[h]
+        self._write(KIND_TORRENTS, ts, {'t': diff, 'r': removed})
+
+    def props(self, ts: float, h: str, props: dict):
+        self._write(KIND_PROPS, ts, {'h': h, **{k: props.get(k) for k in PROPS_FIELDS}})
+
+    def close(self):
+        with self._lock:
+            try: self._f.close()
+            except: pass
+
+def read_log(path: str) -> Iterator[Tuple[bytes, float, dict]]:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC: raise ValueError(f"不是录制日志: {path}")
+        while True:
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size: return
+            kind, ts, n = _HEADER.unpack(head)
+            data = f.read(n)
+            if len(data) < n: return
+            yield kind, ts, json.loads(zlib.decompress(data))
+
+class ReplayTorrent(dict):
+    def __getattr__(self, name: str) -> Any:
+        try: return self[name]
+        except KeyError: raise AttributeError(name)
+
+def iter_ticks(path: str) -> Iterator[Tuple[float, List[ReplayTorrent], List[Tuple[float, dict]]]]:
+    """按 tick 重建种子表，附带该 tick 内录到的 props"""
+    table: Dict[str, ReplayTorrent] = {}
+    pending: Optional[Tuple[float, List[ReplayTorrent]]] = None
+    props: List[Tuple[float, dict]] = []
+    for kind, ts, payload in read_log(path):
+        if kind == KIND_PROPS:
+            props.append((ts, payload)); continue
+        if kind != KIND_TORRENTS: continue
+        if pending: yield pending[0], pending[1], props
+        props = []
+        for h in payload.get('r', []): table.pop(h, None)
+        for h, diff in payload.get('t', {}).items():
+            t = table.get(h)
+            if t is None: t = table[h] = ReplayTorrent(hash=h)
+            t.update(diff)
+        pending = (ts, [ReplayTorrent(t) for t in table.values()])
+    if pending: yield pending[0], pending[1], props
+
+class ReplayClient:
+    """替代 qbittorrentapi.Client 的回放客户端：props 来自录制，限速写入只计数"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._props: Dict[str, Tuple[float, dict]] = {}
+        self.up_limits: Dict[str, int] = {}
+        self.dl_limits: Dict[str, int] = {}
+        self.up_writes = 0
+        self.dl_writes = 0
+        self.reannounces = 0
+        self._lock = threading.Lock()
+
+    def feed_props(self, items: List[Tuple[float, dict]]):
+        for ts, p in items: self._props[p['h']] = (ts, p)
+
+    def torrents_properties(self, torrent_hash: str) -> dict:
+        rec = self._props.get(torrent_hash)
+        if not rec: raise KeyError(torrent_hash)
+        ts, p = rec
+        ra = p.get('reannounce') or 0
+        return {'reannounce': max(0, ra - (self.now - ts)) if ra > 0 else ra}
+
+    def torrents_set_upload_limit(self, limit: int, hashes: List[str]):
+        with self._lock:
+            self.up_writes += 1
+            for h in hashes: self.up_limits[h] = limit
+
+    def torrents_set_download_limit(self, limit: int, hashes: List[str]):
+        with self._lock:
+            self.dl_writes += 1
+            for h in hashes: self.dl_limits[h] = limit
+
+    def torrents_reannounce(self, torrent_hashes: str):
+        self.reannounces += 1
+
+def offline_controller(config_path: str, tmp: str, client: Any, overrides: Optional[dict] = None):
+    """在临时目录里以离线方式构造控制器：独立数据库，关闭 TG/U2/多实例/后台任务与性能快照"""
+    from .controller import Controller
+    with open(config_path, 'r', encoding='utf-8') as f: d = json.load(f)
+    d.update({'db_path': os.path.join(tmp, 'offline.db'), 'telegram_bot_token': '', 'u2_cookie': '',
+              'record_path': '', 'hosts': [], 'flexget_enabled': False, 'autoremove_enabled': False})
+    d.update(overrides or {})
+    cfg_path = os.path.join(tmp, 'config.json')
+    with open(cfg_path, 'w', encoding='utf-8') as f: json.dump(d, f)
+    ctl = Controller(cfg_path)
+    ctl.client = client
+    ctl.actuator.set_client(client)
+    ctl.perf_dump = ""
+    return ctl
+
+def run_replay(log_path: str, config_path: str) -> dict:
+    try: start = next(read_log(log_path))[1]
+    except StopIteration: start = 0.0
+    # 回放期间全局时钟跟随录制时间戳
+    clock = SimClock(start)
+    prev = set_clock(clock)
+    tmp = tempfile.mkdtemp(prefix="qsl-replay-")
+    try:
+        client = ReplayClient()
+        ctl = offline_controller(config_path, tmp, client)
+        cycles: List[dict] = []
+        ctl.cycle_listeners.append(cycles.append)
+
+        ticks = 0; first = last = None
+        cpu0 = time.process_time(); wall0 = time.perf_counter()
+        for ts, torrents, props in iter_ticks(log_path):
+            if first is None: first = ts
+            last = ts; ticks += 1
+            clock.set(ts)
+            client.now = ts
+            client.feed_props(props)
+            for t in torrents:
+                if t.hash in client.up_limits: t['up_limit'] = client.up_limits[t.hash]
+            ctl._tick(torrents, ts)
+        cpu = time.process_time() - cpu0; wall = time.perf_counter() - wall0
+        ctl.running = False
+        ctl.actuator.close(); ctl.writer.close(); ctl.db.close()
+        span = (last - first) if first is not None else 0
+        return {'ticks': ticks, 'span_sec': span, 'cpu_sec': cpu, 'wall_sec': wall,
+                'speedup': span / wall if wall > 0 else 0, 'cpu_per_tick_ms': cpu / ticks * 1000 if ticks else 0,
+                'up_writes': client.up_writes, 'dl_writes': client.dl_writes, 'reannounces': client.reannounces,
+                'cycles': [{k: c.get(k) for k in ('name', 'idx', 'ratio', 'uploaded', 'duration', 'phase')} for c in cycles],
+                'perf': ctl.perf.snapshot()['stages']}
+    finally:
+        set_clock(prev)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def format_report(r: dict) -> str:
+    lines = [f"ticks={r['ticks']} 跨度={r['span_sec']:.0f}s CPU={r['cpu_sec']:.2f}s ({r['cpu_per_tick_ms']:.2f}ms/tick) 加速={r['speedup']:.0f}x",
+             f"限速写入 up={r['up_writes']} dl={r['dl_writes']} 强制汇报={r['reannounces']}"]
+    for c in r['cycles']:
+        lines.append(f"  #{c['idx']:<4} {str(c['name'])[:24]:<24} ratio={c['ratio'] * 100:.2f}% ↑{c['uploaded']} {c['duration']:.0f}s")
+    if r['cycles']:
+        ratios = [c['ratio'] for c in r['cycles']]
+        lines.append(f"周期数={len(ratios)} 平均={sum(ratios) / len(ratios) * 100:.2f}% 精准={sum(1 for x in ratios if abs(x - 1) <= C.PRECISION_GOOD)}")
+    return "\n".join(lines)
@@ -0,0 +1,63 @@
+import heapq
+from typing import Dict, List, Tuple, Iterable, Set
+from .consts import C
+
+def eval_interval(tl: float, phase: str) -> float:
+    for bound, interval in C.SCHED_LADDER:
+        if tl <= bound: return interval
+    if phase == C.PHASE_WARMUP: return C.SCHED_LADDER[-1][1]
+    # 远离汇报时逐步放宽，但保证在进入 steady 之前被唤醒
+    return min(C.SCHED_MAX_INTERVAL, max(C.SCHED_LADDER[-1][1], (tl - C.STEADY_TIME) / 4))
+
+class DeadlineScheduler:
+    """按种子各自的下次评估时间调度 _process (惰性删除的最小堆)"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadline: Dict[str, float] = {}
+        self.last_due = 0
+
+    def schedule(self, h: str, deadline: float):
+        self._deadline[h] = deadline
+        heapq.heappush(self._heap, (deadline, h))
+
+    def discard(self, h: str):
+        self._deadline.pop(h, None)
+
+    def pop_due(self, now: float, active: Iterable[str]) -> Set[str]:
+        due = {h for h in active if h not in self._deadline}
+        while self._heap and self._heap[0][0] <= now:
+            deadline, h = heapq.heappop(self._heap)
+            if self._deadline.get(h) == deadline:
+                del self._deadline[h]
+                due.add(h)
+        if len(self._heap) > 4 * len(self._deadline) + 64:
+            self._heap = [(d, h) for h, d in self._deadline.items()]
+            heapq.heapify(self._heap)
+        self.last_due = len(due)
+        return due
+
+    def next_deadline(self, default: float) -> float:
+        while self._heap and self._deadline.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else default
+
+class PropsRefreshQueue:
+    """按临近汇报程度与 cached_tl 陈旧度排序 torrents_properties 刷新请求"""
+    PHASE_RANK = {C.PHASE_FINISH: 0, C.PHASE_STEADY: 1, C.PHASE_CATCH: 2, C.PHASE_WARMUP: 3}
+
+    def __init__(self):
+        self.skipped: Dict[str, int] = {p: 0 for p in self.PHASE_RANK}
+        self.fetched: Dict[str, int] = {p: 0 for p in self.PHASE_RANK}
+
+    def order(self, candidates: Iterable[Tuple[str, str, float, float]]) -> List[Tuple[str, str]]:
+        # candidates: (hash, phase, tl, staleness)，staleness 以该阶段缓存周期为单位
+        ranked = sorted(candidates, key=lambda c: (self.PHASE_RANK.get(c[1], 3), c[2] - C.PROPS_STALE_WEIGHT * c[3]))
+        return [(h, phase) for h, phase, _, _ in ranked]
+
+    def mark(self, phase: str, fetched: bool):
+        counter = self.fetched if fetched else self.skipped
+        counter[phase] = counter.get(phase, 0) + 1
+
+    def summary(self) -> str:
+        return " ".join(f"{p[0].upper()}={self.fetched[p]}/{self.skipped[p]}" for p in self.PHASE_RANK)
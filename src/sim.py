@@ -0,0 +1,181 @@
+"""加速仿真: python -m src.sim [--config config.json] [--torrents 4] [--downloading 0] [--hours 24] [--seed 1]"""
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Optional
+from .consts import C
+from .utils import SimClock, set_clock, estimate_announce_interval
+from .replay import ReplayTorrent, offline_controller
+
+SIM_START = 1_700_000_000.0
+SIM_TRACKER = "https://sim.tracker/announce"
+
+class SimTorrent:
+    """仿真种子：上传 (及下载) 能力按秒随机游走，偶尔因 peer 离开骤降；按 tracker 间隔汇报，下载完成时立即汇报"""
+    __slots__ = ('hash', 'name', 'size', 'added_on', 'interval', 'base', 'cap', 'limit', 'dl_limit', 'uploaded',
+                 'speed', 'done', 'dl_base', 'dl_cap', 'dl_speed', 'ts', 'next_step', 'next_announce', 'cycle_up',
+                 'cycle_start', 'cycles')
+
+    def __init__(self, i: int, now: float, target: float, rnd: random.Random, downloading: bool = False):
+        self.hash = f"{i:040x}"
+        self.name = f"sim-{i}"
+        self.size = int(rnd.uniform(1, 64) * 1073741824)
+        self.added_on = now - (0 if downloading else rnd.uniform(0, 60) * 86400)
+        self.interval = estimate_announce_interval(self.added_on, now)
+        self.base = target * rnd.uniform(0.7, 2.5)
+        self.cap = self.base
+        self.limit = -1; self.dl_limit = -1
+        self.uploaded = 0.0; self.speed = 0.0
+        # 下载中的种子：下载能力约为上传均值上限的 1~3 倍
+        self.done = 0.0 if downloading else float(self.size)
+        self.dl_base = C.SPEED_LIMIT * rnd.uniform(1, 3); self.dl_cap = self.dl_base; self.dl_speed = 0.0
+        self.ts = now; self.next_step = now + 1
+        self.next_announce = now + rnd.uniform(0, self.interval)
+        self.cycle_up = 0.0; self.cycle_start = 0.0
+        self.cycles: List[tuple] = []  # (时长, 上传量)
+
+    def announce(self, now: float):
+        # 首次汇报之前的半个周期不计
+        if self.cycle_start > 0: self.cycles.append((now - self.cycle_start, self.uploaded - self.cycle_up))
+        self.cycle_start = now; self.cycle_up = self.uploaded
+        self.next_announce = now + self.interval
+
+    @property
+    def downloading(self) -> bool:
+        return self.done < self.size
+
+    def advance(self, now: float, target: float, rnd: random.Random):
+        while self.ts < now:
+            self.speed = self.cap if self.limit <= 0 else min(self.cap, self.limit)
+            self.dl_speed = 0.0
+            nxt = min(now, self.next_step, self.next_announce); finish = float('inf')
+            if self.downloading:
+                self.dl_speed = self.dl_cap if self.dl_limit <= 0 else min(self.dl_cap, self.dl_limit)
+                if self.dl_speed > 0: finish = self.ts + (self.size - self.done) / self.dl_speed
+            if finish <= nxt: nxt = finish
+            dt = nxt - self.ts
+            self.uploaded += self.speed * dt
+            if self.dl_speed > 0:
+                # 完成时刻直接置满，避免浮点误差留下永远走不完的余量
+                self.done = float(self.size) if nxt >= finish else self.done + self.dl_speed * dt
+                if not self.downloading: self.announce(nxt)
+            self.ts = nxt
+            if nxt >= self.next_announce: self.announce(nxt)
+            if nxt >= self.next_step:
+                self.next_step += 1
+                self.cap = max(target * 0.05, self.cap * (1 + rnd.gauss(0, 0.05)) + (self.base - self.cap) * 0.05)
+                if rnd.random() < 0.01: self.cap *= rnd.uniform(0.3, 0.8)
+                self.dl_cap = max(C.SPEED_LIMIT * 0.1, self.dl_cap * (1 + rnd.gauss(0, 0.15)) + (self.dl_base - self.dl_cap) * 0.1)
+
+class SimClient:
+    """替代 qbittorrentapi.Client 的仿真 qB：时间取自仿真时钟，限速立即作用于上传"""
+
+    def __init__(self, clock: SimClock, n: int, target: float, seed: int = 1, downloading: int = 0):
+        self.clock = clock
+        self.target = target
+        self._rnd = random.Random(seed)
+        self.torrents: Dict[str, SimTorrent] = {}
+        for i in range(n):
+            t = SimTorrent(i, clock.time(), target, self._rnd, i < downloading)
+            self.torrents[t.hash] = t
+        self.up_writes = 0
+        self.dl_writes = 0
+        self.reannounces = 0
+        self._lock = threading.Lock()
+
+    def _advance(self):
+        now = self.clock.time()
+        for t in self.torrents.values(): t.advance(now, self.target, self._rnd)
+
+    def torrents_info(self, status_filter: Optional[str] = None, **kwargs) -> List[ReplayTorrent]:
+        with self._lock:
+            self._advance()
+            return [ReplayTorrent(hash=t.hash, name=t.name, state='downloading' if t.downloading else 'uploading',
+                                  upspeed=int(t.speed), dlspeed=int(t.dl_speed), uploaded=int(t.uploaded), completed=int(t.done),
+                                  downloaded=int(t.done), total_size=t.size, up_limit=t.limit, tracker=SIM_TRACKER,
+                                  eta=int((t.size - t.done) / t.dl_speed) if t.downloading and t.dl_speed > 0 else 8640000,
+                                  added_on=int(t.added_on))
+                    for t in self.torrents.values()]
+
+    def torrents_properties(self, torrent_hash: str) -> dict:
+        with self._lock:
+            self._advance()
+            t = self.torrents[torrent_hash]
+            return {'reannounce': int(t.next_announce - self.clock.time())}
+
+    def torrents_set_upload_limit(self, limit: int, hashes: List[str]):
+        with self._lock:
+            self._advance()
+            self.up_writes += 1
+            for h in hashes:
+                if h in self.torrents: self.torrents[h].limit = limit
+
+    def torrents_set_download_limit(self, limit: int, hashes: List[str]):
+        with self._lock:
+            self.dl_writes += 1
+            for h in hashes:
+                if h in self.torrents: self.torrents[h].dl_limit = limit
+
+    def torrents_reannounce(self, torrent_hashes: str):
+        with self._lock:
+            self._advance()
+            self.reannounces += 1
+            t = self.torrents.get(torrent_hashes)
+            if t: t.announce(self.clock.time())
+
+def run_sim(config_path: str, torrents: int = 4, hours: float = 24, seed: int = 1, overrides: Optional[dict] = None,
+            downloading: int = 0) -> dict:
+    """以仿真时钟驱动完整主循环 (_step)，周期比例按仿真 qB 实际汇报的上传量统计"""
+    clock = SimClock(SIM_START)
+    prev = set_clock(clock)
+    tmp = tempfile.mkdtemp(prefix="qsl-sim-")
+    try:
+        ctl = offline_controller(config_path, tmp, None, dict({'use_sync_maindata': False}, **(overrides or {})))
+        target = ctl._get_effective_target()
+        client = SimClient(clock, torrents, target, seed, downloading)
+        ctl.client = client
+        ctl.actuator.set_client(client)
+        end = SIM_START + hours * 3600; steps = 0
+        cpu0 = time.process_time(); wall0 = time.perf_counter()
+        while clock.time() < end:
+            clock.sleep(ctl._step()); steps += 1
+        cpu = time.process_time() - cpu0; wall = time.perf_counter() - wall0
+        ctl.running = False
+        ctl.actuator.close(); ctl.writer.close(); ctl.db.close()
+        cycles = [{'name': t.name, 'duration': d, 'uploaded': int(u), 'ratio': u / (target * d) if d > 0 else 0}
+                  for t in client.torrents.values() for d, u in t.cycles]
+        return {'steps': steps, 'span_sec': hours * 3600, 'cpu_sec': cpu, 'wall_sec': wall,
+                'speedup': hours * 3600 / wall if wall > 0 else 0, 'up_writes': client.up_writes,
+                'dl_writes': client.dl_writes, 'reannounces': client.reannounces, 'cycles': cycles}
+    finally:
+        set_clock(prev)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def format_report(r: dict) -> str:
+    lines = [f"steps={r['steps']} 仿真={r['span_sec'] / 3600:.1f}h 耗时={r['wall_sec']:.1f}s (CPU {r['cpu_sec']:.1f}s) 加速={r['speedup']:.0f}x",
+             f"限速写入 up={r['up_writes']} dl={r['dl_writes']} 强制汇报={r['reannounces']}"]
+    ratios = [c['ratio'] for c in r['cycles']]
+    if ratios:
+        lines.append(f"周期数={len(ratios)} 平均={sum(ratios) / len(ratios) * 100:.2f}% "
+                     f"精准={sum(1 for x in ratios if abs(x - 1) <= C.PRECISION_GOOD)} 超标={sum(1 for x in ratios if x > 1 + C.PRECISION_GOOD)} "
+                     f"均值超限={sum(1 for c in r['cycles'] if c['uploaded'] > C.SPEED_LIMIT * c['duration'])}")
+    return "\n".join(lines)
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.sim")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--torrents", type=int, default=4)
+    parser.add_argument("--downloading", type=int, default=0, help="其中从零开始下载的种子数")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    print(format_report(run_sim(args.config, args.torrents, args.hours, args.seed, {'log_level': args.log_level}, args.downloading)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Any
+from .consts import C
+
+class SyncTorrent(dict):
+    """sync/maindata 中的单个种子条目，支持与 TorrentDictionary 相同的属性访问"""
+    def __getattr__(self, name: str) -> Any:
+        try: return self[name]
+        except KeyError: raise AttributeError(name)
+
+    def is_active(self) -> bool:
+        # 对齐 qB 的 status_filter='active'：有速度，或处于下载/校验类状态
+        if (self.get('upspeed', 0) or 0) > 0 or (self.get('dlspeed', 0) or 0) > 0: return True
+        return self.get('state', '') in C.SYNC_ACTIVE_STATES
+
+@dataclass
+class SyncStats:
+    ticks: int = 0
+    full_updates: int = 0
+    last_changed: int = 0
+    total_changed: int = 0
+    table_size: int = 0
+    last_response: Any = None  # 最近一次响应，仅在输出统计时估算其大小
+
+    def record(self, changed: int, full: bool, table_size: int, response: Any = None):
+        self.ticks += 1
+        self.last_changed = changed; self.total_changed += changed
+        self.table_size = table_size
+        self.last_response = response
+        if full: self.full_updates += 1
+
+    def summary(self) -> str:
+        n = max(1, self.ticks)
+        # 按紧凑 JSON 重新序列化估算，非实际传输字节
+        est = len(json.dumps(self.last_response, separators=(',', ':'), ensure_ascii=False).encode('utf-8')) if self.last_response is not None else 0
+        return (f"sync ticks={self.ticks} full={self.full_updates} table={self.table_size} "
+                f"avg={self.total_changed / n:.1f}种子 last={self.last_changed}种子/≈{est}B(估算)")
+
+class MainDataSync:
+    """基于 sync/maindata rid 协议的增量种子表"""
+
+    def __init__(self, client=None):
+        self.client = client
+        self.rid = 0
+        self.torrents: Dict[str, SyncTorrent] = {}
+        self.stats = SyncStats()
+
+    def reset(self, client=None):
+        if client is not None: self.client = client
+        self.rid = 0
+        self.torrents.clear()
+
+    def poll(self) -> List[SyncTorrent]:
+        data = self.client.sync_maindata(rid=self.rid)
+        full = bool(data.get('full_update'))
+        if full: self.torrents.clear()
+
+        diffs = data.get('torrents') or {}
+        for h, diff in diffs.items():
+            t = self.torrents.get(h)
+            if t is None: t = self.torrents[h] = SyncTorrent(hash=h)
+            t.update(diff)
+        removed = data.get('torrents_removed') or []
+        for h in removed: self.torrents.pop(h, None)
+        self.rid = data.get('rid', self.rid)
+
+        self.stats.record(len(diffs) + len(removed), full, len(self.torrents), data)
+        return [t for t in self.torrents.values() if t.is_active()]
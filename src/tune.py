@@ -0,0 +1,156 @@
+"""离线调参: python -m src.tune [--search random|grid] [--trials 200] [--synthetic 32] [--log rec.bin] [--out tuning.json]"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Any
+from .consts import C
+from .config import default_tuning, apply_tuning
+from .algorithms import PrecisionLimitController
+from .scheduler import eval_interval
+from .utils import get_phase
+
+CYCLE = 1800
+TARGET = 50 * 1024 * 1024 / 8
+# 评分权重：每 1% 比例误差 (相对可达比例) 1 分，超标再加 3 倍，每次限速写入 0.01 分
+W_ERROR = 100.0
+W_OVER = 300.0
+W_WRITE = 0.01
+QUANT_CHOICES = (256, 512, 1024, 2048, 4096, 8192)
+GRID_SCALES = (0.5, 1.0, 1.5)
+
+Trace = Tuple[List[float], List[float]]  # (相对周期起点的秒数, 该时刻的可用上传能力 B/s)
+
+def synthetic_traces(n: int, seed: int = 7) -> List[Trace]:
+    """合成周期：能力围绕基准随机游走，偶尔因 peer 离开骤降"""
+    rnd = random.Random(seed)
+    traces = []
+    for _ in range(n):
+        base = TARGET * rnd.uniform(0.7, 2.5)
+        cap = base; ts = []; caps = []
+        for t in range(CYCLE):
+            cap = max(TARGET * 0.05, cap * (1 + rnd.gauss(0, 0.05)) + (base - cap) * 0.05)
+            if rnd.random() < 0.01: cap *= rnd.uniform(0.3, 0.8)
+            ts.append(float(t)); caps.append(cap)
+        traces.append((ts, caps))
+    return traces
+
+def recorded_traces(path: str) -> List[Trace]:
+    """从录制日志切出周期长度的能力曲线；只采信未限速时的 upspeed，限速期间沿用上一个值"""
+    from .replay import iter_ticks
+    series: Dict[str, List[Tuple[float, float]]] = {}
+    last: Dict[str, float] = {}
+    for ts, torrents, _ in iter_ticks(path):
+        for t in torrents:
+            limit = t.get('up_limit') or -1
+            speed = t.get('upspeed') or 0
+            if limit <= 0 or speed < limit * 0.9: last[t.hash] = speed
+            if t.hash in last: series.setdefault(t.hash, []).append((ts, last[t.hash]))
+    traces = []
+    for points in series.values():
+        start = points[0][0]; ts: List[float] = []; caps: List[float] = []
+        for at, cap in points:
+            if at - start >= CYCLE:
+                if ts and ts[-1] >= CYCLE * 0.8: traces.append((ts, caps))
+                start = at; ts = []; caps = []
+            ts.append(at - start); caps.append(cap)
+    return traces
+
+def simulate(trace: Trace, target: float = TARGET) -> Tuple[float, float, int]:
+    """按调度阶梯驱动一个已同步周期，返回 (周期比例, 能力上限可达的比例, 限速写入次数)"""
+    ts, caps = trace
+    ctrl = PrecisionLimitController()
+    t = 0.0; uploaded = 0.0; capacity = 0.0; limit = -1; writes = 0
+    while t < CYCLE:
+        tl = CYCLE - t
+        dt = min(eval_interval(tl, get_phase(tl, True)), tl)
+        cap = caps[max(0, bisect_right(ts, t) - 1)]
+        speed = cap if limit <= 0 else min(cap, limit)
+        uploaded += speed * dt; capacity += cap * dt; t += dt
+        ctrl.record_speed(t, speed)
+        if t >= CYCLE: break
+        new = ctrl.calculate(target, int(uploaded), CYCLE - t, t, get_phase(CYCLE - t, True), t)[0]
+        if new != limit: writes += 1; limit = new
+    return uploaded / (target * CYCLE), min(1.0, capacity / (target * CYCLE)), writes
+
+def evaluate(job: Tuple[dict, List[Trace]]) -> Dict[str, Any]:
+    params, traces = job
+    apply_tuning(params)
+    score = 0.0; ratios = []; writes = 0
+    for trace in traces:
+        ratio, reachable, w = simulate(trace)
+        # 能力不足的周期只按可达比例计误差
+        score += W_ERROR * abs(ratio - reachable) + W_OVER * max(0.0, ratio - 1) + W_WRITE * w
+        ratios.append(ratio); writes += w
+    n = max(1, len(traces))
+    return {'score': score / n, 'mean_ratio': sum(ratios) / n, 'max_over': max([r - 1 for r in ratios] + [0.0]),
+            'precise': sum(1 for r in ratios if abs(r - 1) <= C.PRECISION_GOOD) / n, 'writes': writes / n}
+
+def random_params(rnd: random.Random) -> dict:
+    t = default_tuning()
+    for p in t['PID_PARAMS'].values():
+        for k in ('kp', 'ki', 'kd'): p[k] = round(p[k] * math.exp(rnd.uniform(-0.7, 0.7)), 4)
+    t['QUANT_STEPS'] = {phase: rnd.choice(QUANT_CHOICES) for phase in t['QUANT_STEPS']}
+    for k in ('KALMAN_Q_SPEED', 'KALMAN_Q_ACCEL', 'KALMAN_R'): t[k] = round(t[k] * 10 ** rnd.uniform(-1, 1), 5)
+    return t
+
+def grid_params() -> List[dict]:
+    """kp/ki/kd、量化步长、Kalman R 各取 GRID_SCALES 倍，全阶段同比缩放"""
+    result = []
+    for kp in GRID_SCALES:
+        for ki in GRID_SCALES:
+            for kd in GRID_SCALES:
+                for q in GRID_SCALES:
+                    for r in (0.1, 1.0, 10.0):
+                        t = default_tuning()
+                        for p in t['PID_PARAMS'].values():
+                            p['kp'] = round(p['kp'] * kp, 4); p['ki'] = round(p['ki'] * ki, 4); p['kd'] = round(p['kd'] * kd, 4)
+                        t['QUANT_STEPS'] = {ph: int(min(8192, max(256, s * q))) for ph, s in t['QUANT_STEPS'].items()}
+                        t['KALMAN_R'] = t['KALMAN_R'] * r
+                        result.append(t)
+    return result
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.tune")
+    parser.add_argument("--search", choices=['random', 'grid'], default='random')
+    parser.add_argument("--trials", type=int, default=200, help="random 搜索的候选数")
+    parser.add_argument("--synthetic", type=int, default=32, help="合成周期数")
+    parser.add_argument("--log", action='append', default=[], help="录制日志 (可多次指定)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="tuning.json")
+    args = parser.parse_args(argv)
+
+    traces = synthetic_traces(args.synthetic, args.seed) if args.synthetic > 0 else []
+    for path in args.log: traces += recorded_traces(path)
+    if not traces:
+        print("❌ 没有可用的周期曲线"); return 1
+    rnd = random.Random(args.seed)
+    candidates = [default_tuning()] + (grid_params() if args.search == 'grid' else [random_params(rnd) for _ in range(args.trials)])
+    print(f"🎛️ {len(candidates)} 组参数 × {len(traces)} 个周期, {args.workers} 进程")
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(evaluate, [(c, traces) for c in candidates], chunksize=max(1, len(candidates) // (args.workers * 4))))
+    baseline = results[0]
+    ranked = sorted(range(len(candidates)), key=lambda i: results[i]['score'])
+    for i in ranked[:5]:
+        r = results[i]
+        print(f"  score={r['score']:.3f} ratio={r['mean_ratio'] * 100:.2f}% 精准={r['precise'] * 100:.0f}% 超标={r['max_over'] * 100:.2f}% 写入={r['writes']:.0f}{' (当前)' if i == 0 else ''}")
+    best = ranked[0]
+    print(f"⏱ {time.perf_counter() - t0:.1f}s 当前 score={baseline['score']:.3f} → 最优 {results[best]['score']:.3f}")
+
+    profile = dict(candidates[best])
+    profile['_meta'] = {'score': results[best], 'baseline': baseline, 'traces': len(traces), 'search': args.search,
+                        'candidates': len(candidates), 'generated_at': time.time()}
+    with open(args.out, 'w', encoding='utf-8') as f: json.dump(profile, f, indent=2, ensure_ascii=False)
+    print(f"💾 已写入 {args.out}，在 config.json 中设置 \"tuning_profile\": \"{args.out}\" 启用")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
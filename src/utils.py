@@ -7,6 +7,7 @@ from collections import deque
 from typing import Optional, List, Deque
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
+from urllib.parse import urlparse
 from .consts import C
 
 def fmt_size(b: float, precision: int = 2) -> str:
@@ -47,14 +48,47 @@ def get_phase(tl: float, synced: bool) -> str:
     if tl <= C.STEADY_TIME: return C.PHASE_STEADY
     return C.PHASE_CATCH
 
-def estimate_announce_interval(time_ref: float) -> int:
-    age = time.time() - time_ref
-    if age < 7 * 86400: return C.ANNOUNCE_INTERVAL_NEW
-    elif age < 30 * 86400: return C.ANNOUNCE_INTERVAL_WEEK
-    return C.ANNOUNCE_INTERVAL_OLD
+def announce_age_band(time_ref: float, now: float) -> int:
+    age = now - time_ref
+    for i, days in enumerate(C.ANNOUNCE_AGE_BANDS_DAYS):
+        if age < days * 86400: return i
+    return len(C.ANNOUNCE_AGE_BANDS_DAYS)
+
+def estimate_announce_interval(time_ref: float, now: Optional[float] = None) -> int:
+    band = announce_age_band(time_ref, wall_time() if now is None else now)
+    return (C.ANNOUNCE_INTERVAL_NEW, C.ANNOUNCE_INTERVAL_WEEK, C.ANNOUNCE_INTERVAL_OLD)[band]
+
+def tracker_host(url: str) -> str:
+    if not url: return ""
+    try: return urlparse(url).hostname or ""
+    except ValueError: return ""
+
+class Clock:
+    """控制逻辑的时间来源；主循环的等待也经由时钟，便于仿真时替换"""
+    def time(self) -> float: return time.time()
+    def sleep(self, seconds: float): time.sleep(seconds)
+
+class SimClock(Clock):
+    """仿真时钟：sleep 直接推进时间"""
+    def __init__(self, start: float = 0.0):
+        self.now = start
+    def time(self) -> float: return self.now
+    def sleep(self, seconds: float): self.now += max(0.0, seconds)
+    def set(self, now: float): self.now = now
+
+_clock: Clock = Clock()
+
+def get_clock() -> Clock:
+    return _clock
+
+def set_clock(clock: Optional[Clock]) -> Clock:
+    """替换全局时钟 (None 恢复真实时钟)，返回原时钟"""
+    global _clock
+    prev, _clock = _clock, clock or Clock()
+    return prev
 
 def wall_time() -> float:
-    return time.time()
+    return _clock.time()
 
 def parse_speed_str(s: str) -> Optional[int]:
     s = s.strip().upper()
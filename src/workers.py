@@ -262,7 +262,7 @@ class AutoRemoveWorker(threading.Thread):
             try:
                 if hasattr(self.c, 'notifier'): self.c.notifier.autoremove_notify(info)
                 self.c.client.torrents_delete(delete_files=True, torrent_hashes=t.hash)
-                self.c.db.delete_torrent_state(t.hash)
+                self.c.delete_state(t.hash)
                 keys_to_rm = [k for k in self.state["since"] if k.startswith(t.hash)]
                 for k in keys_to_rm: del self.state["since"][k]
                 logger.warning(f"Deleted: {t.name} [{reason}]")